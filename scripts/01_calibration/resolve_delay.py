@@ -3,12 +3,20 @@ import socket
 import json
 import numpy as np
 import time
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_protocol import FrameSender
+from led_render import FrameBuffer
 
 # =============================
 # CONFIGURATION
 # =============================
 UDP_IP = "192.168.1.107"
 UDP_PORT = 5005
+FRAME_ENCODING = "delta"  # "raw", "rle" or "delta", see led_protocol.py
+PRESENTATION_LATENCY = 0.1  # seconds from sending a frame to the Pi showing it; must cover Wi-Fi jitter
 
 NUM_LEDS = 600
 
@@ -34,6 +42,7 @@ def select_input_device():
 SYSTEM_AUDIO_INDEX = select_input_device()
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+sender = FrameSender(sock, (UDP_IP, UDP_PORT), FRAME_ENCODING, latency=PRESENTATION_LATENCY)
 
 samplerate = 44100
 # Use a smaller hop for lower latency / more responsiveness
@@ -41,12 +50,12 @@ win_s = 1024
 hop_s = 256   # was 512
 
 # --- State for flash hold ---
-led_buffer = np.zeros((NUM_LEDS, 3), dtype=float)
+led_frame = FrameBuffer(NUM_LEDS)
 last_send_time = 0.0
 
 def audio_callback(indata, frames, time_info, status):
 
-    global led_buffer, last_send_time
+    global last_send_time
 
     if status:
         print("Audio status:", status)
@@ -57,20 +66,17 @@ def audio_callback(indata, frames, time_info, status):
     energy = np.sqrt(np.mean(mono**2)) # RMS energy
 
     if energy > 0.01:
-         print("Lights ON")
-        led_buffer[:] = 255
+        print("Lights ON")
+        led_frame.fill(255)
 
     # Limit update rate to ~30 FPS to prevent network/LED flooding
     if now - last_send_time > 0.033:
-        # Clip to valid range and convert to bytes
-        output_frame = np.clip(led_buffer, 0, 255).astype(int)
-        packet = bytearray([c for pixel in output_frame for c in pixel])
         try:
-            sock.sendto(packet, (UDP_IP, UDP_PORT))
+            sender.send(led_frame.commit())
         except Exception as e:
             print("UDP send error:", e)
         last_send_time = now
-        led_buffer[:] = 0
+        led_frame.clear()
 
 # --- Main Loop ---
 print("Starting music-reactive lights. Press Ctrl+C to stop.")
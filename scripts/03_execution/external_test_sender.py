@@ -0,0 +1,60 @@
+import colorsys
+import os
+import socket
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_external import DDP_PORT, E131Sender, ddp_packets
+from led_render import FrameClock
+
+# =============================
+# CONFIGURATION
+# =============================
+UDP_IP = "192.168.1.107"
+NUM_LEDS = 600
+FRAME_RATE = 30
+E131_START_UNIVERSE = 1
+E131_SYNC_ADDRESS = 7  # used with "sync"; any universe number not carrying pixels
+
+# Stands in for lighting software to check the Pi's DDP / E1.31 input:
+# sends a rainbow scrolling along the global pixel index.
+# Usage: python external_test_sender.py <ddp|e131> [sync]
+#   python external_test_sender.py ddp
+#   python external_test_sender.py e131 sync
+if len(sys.argv) < 2 or sys.argv[1] not in ("ddp", "e131"):
+    print("Usage: python external_test_sender.py <ddp|e131> [sync]")
+    exit(1)
+
+protocol = sys.argv[1]
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+if protocol == "e131":
+    sync_address = E131_SYNC_ADDRESS if "sync" in sys.argv[2:] else 0
+    e131 = E131Sender(sock, UDP_IP, E131_START_UNIVERSE, sync_address=sync_address)
+
+
+def send(pixels):
+    if protocol == "ddp":
+        for packet in ddp_packets(pixels):
+            sock.sendto(packet, (UDP_IP, DDP_PORT))
+    else:
+        e131.send(pixels)
+
+
+def rainbow_frame(t):
+    frame = bytearray()
+    for i in range(NUM_LEDS):
+        r, g, b = colorsys.hsv_to_rgb((i / NUM_LEDS + t * 0.2) % 1.0, 1.0, 1.0)
+        frame += bytes([int(r * 255), int(g * 255), int(b * 255)])
+    return frame
+
+
+print(f"Sending a {NUM_LEDS} LED rainbow over {protocol} to {UDP_IP}. Press Ctrl+C to stop.")
+clock = FrameClock(FRAME_RATE)
+try:
+    while True:
+        send(rainbow_frame(clock.tick()))
+except KeyboardInterrupt:
+    print("Stopped by user")
+finally:
+    send(bytes(NUM_LEDS * 3))
+    sock.close()
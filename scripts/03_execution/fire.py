@@ -1,31 +1,37 @@
 import socket
 import json
-import random
 import numpy as np
 import time
-import math
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_protocol import FrameSender
+from led_effects import Fire, palette_lut
+from led_show import ShowWriter
+from led_render import FrameBuffer, FrameClock, PiEffect, VirtualClock
 
 # =============================
 # CONFIGURATION
 # =============================
 UDP_IP = "192.168.1.107"
 UDP_PORT = 5005
+FRAME_ENCODING = "delta"  # "raw", "rle" or "delta", see led_protocol.py
+PRESENTATION_LATENCY = 0.1  # seconds from sending a frame to the Pi showing it; must cover Wi-Fi jitter
+LAYER_SOURCE = 0  # layer on the Pi, higher is drawn on top; background layer
+LAYER_BLEND = "replace"  # "replace", "alpha", "add" or "max", see led_protocol.BLEND_MODES
 
 COORDS_FILE = "savedata_adjusted.json"
 
-# Load LED coordinates and determine NUM_LEDS from them
-try:
-    with open(COORDS_FILE, 'r') as f:
-        led_coords = np.array(json.load(f))
-    NUM_LEDS = len(led_coords)
-except FileNotFoundError:
-    print(f"Error: Coordinate file not found at {COORDS_FILE}")
-    exit(1)
+# Usage: python fire.py                              stream to the Pi
+#        python fire.py <show file> <seconds> [compress]
+#            render to a show file for play_show.py instead, as fast as possible
 
 # =============================
 # FIRE EFFECT CONFIGURATION
 # =============================
-FRAME_RATE = 30
+FRAME_RATE = 30  # upper limit; the Pi's feedback lowers it when it can't keep up
+STATS_LOG_INTERVAL = 10.0  # seconds between frame timing lines
 
 # --- Noise parameters to control the fire's appearance ---
 # Lower scale = larger, slower flames. Higher scale = smaller, faster flames.
@@ -36,107 +42,83 @@ NOISE_SCALE_Z = 1.5
 # How fast the fire rises
 TIME_SCALE = 0.6
 
-# --- Spatial setup ---
-y_coords = led_coords[:, 1]
-min_y, max_y = np.min(y_coords), np.max(y_coords)
-tree_height = max_y - min_y
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+# Colours heat is mapped to: a led_effects.PALETTE_STOPS name ("fire", "ice",
+# "forest", "white", "rainbow") or a list of [position, r, g, b] stops
+PALETTE = "fire"
 
-def simple_noise3(x, y, z):
+class FireEffect(PiEffect):
     """
-    Generates a procedural, continuous noise-like value between 0.0 and 1.0
-    for a 3D point using a combination of sine waves.
-    This avoids the need for an external noise library.
+    Rising noise flames, hottest at the bottom of the tree: led_effects.Fire,
+    the fire the Pi renders itself (pi_effect.py fire), with the noise
+    settings above. set_palette() swaps the colours while running.
     """
-    # Combine sine waves at different frequencies and offsets to create a complex pattern.
-    # The specific multipliers are chosen to create a visually interesting, non-uniform flow.
-    v1 = math.sin(x * 0.5 + y * 0.2 + z * 0.3)
-    v2 = math.sin(x * 1.2 - y * 0.8 + z * 0.7)
-    v3 = math.sin(x * 2.1 + y * 1.5 - z * 1.3)
 
-    # Average the sine waves (each is -1 to 1) and normalize the result to a 0-1 range.
-    # (v1+v2+v3) is from -3 to 3. Adding 3 makes it 0 to 6. Dividing by 6 makes it 0 to 1.
-    return (v1 + v2 + v3 + 3.0) / 6.0
-
-def heat_to_color(heat):
-    """
-    Maps a heat value (0.0 to 1.0) to a fire-like color.
-    0.0 -> black
-    ... -> red
-    ... -> orange
-    ... -> yellow
-    1.0 -> white
-    """
-    heat = max(0, min(1, heat))
-    if heat < 0.2:
-        # Fade from black to dark red
-        return [int(heat * 5 * 60), 0, 0]
-    elif heat < 0.5:
-        # Fade from dark red to bright red
-        return [60 + int((heat - 0.2) / 0.3 * 195), 0, 0]
-    elif heat < 0.8:
-        # Fade from red to yellow
-        g = int((heat - 0.5) / 0.3 * 255)
-        return [255, g, 0]
-    else:
-        # Fade from yellow to white
-        b = int((heat - 0.8) / 0.2 * 255)
-        return [255, 255, b]
-
-def generate_fire_frame(t):
-    """
-    Generates a single frame of the fire animation.
-    't' is the current time, used to animate the noise.
-    """
-    frame = [[0, 0, 0] for _ in range(NUM_LEDS)]
-    
-    for i in range(NUM_LEDS):
-        # Get LED's 3D coordinates
-        x, y, z = led_coords[i]
-
-        # Calculate noise value. The y-coordinate is offset by time to make the fire "rise".
-        noise_val = simple_noise3(x * NOISE_SCALE_X,
-                                  (y - t * TIME_SCALE) * NOISE_SCALE_Y,
-                                  z * NOISE_SCALE_Z)
-
-        # Make the fire stronger at the bottom and fade out towards the top
-        # 'y_falloff' will be 1.0 at the bottom and 0.0 at the top.
-        y_falloff = 1.0 - ((y - min_y) / tree_height)
-        
-        # The final "heat" is the noise value modulated by the vertical falloff.
-        # We square the falloff to make the base of the fire hotter and more distinct.
-        heat = noise_val * (y_falloff ** 2)
-
-        frame[i] = heat_to_color(heat)
-        
-    return frame
-
-# --- Main Loop ---
-print("Starting fire effect. Press Ctrl+C to stop.")
-start_time = time.time()
-try:
-    while True:
-        current_time = time.time() - start_time
-        
-        # Generate the frame
-        final_frame = generate_fire_frame(current_time)
-        
-        # Pack and send the data
-        packet = bytearray([int(c) for color in final_frame for c in color])
-        sock.sendto(packet, (UDP_IP, UDP_PORT))
-        
-        # Wait to maintain the desired frame rate
-        time.sleep(1.0 / FRAME_RATE)
-
-except KeyboardInterrupt:
-    print("Stopped by user")
-except Exception as e:
-    print("Error:", e)
-finally:
-    # Send a final black frame to turn off all LEDs
-    print("Turning off LEDs.")
-    black_frame = [[0, 0, 0] for _ in range(NUM_LEDS)]
-    packet = bytearray([int(c) for color in black_frame for c in color])
-    sock.sendto(packet, (UDP_IP, UDP_PORT))
-    sock.close()
\ No newline at end of file
+    def __init__(self, coords, palette=PALETTE):
+        super().__init__(Fire(coords, {"palette": palette, "speed": TIME_SCALE, "scale_x": NOISE_SCALE_X,
+                                       "scale_y": NOISE_SCALE_Y, "scale_z": NOISE_SCALE_Z}))
+
+    def set_palette(self, palette):
+        self.effect.lut = palette_lut(palette, self.effect.params["brightness"])
+
+def render_to_file(led_coords, path, seconds, compress=False):
+    """Renders seconds of fire into a show file for play_show.py, as fast as the CPU allows."""
+    frame = FrameBuffer(len(led_coords))
+    fire = FireEffect(led_coords)
+    clock = VirtualClock(FRAME_RATE)
+    started = time.perf_counter()
+    with ShowWriter(path, len(led_coords), FRAME_RATE, compress) as show:
+        for _ in range(round(seconds * FRAME_RATE)):
+            fire.render(clock.tick(), frame)
+            show.write(frame.commit())
+    elapsed = time.perf_counter() - started
+    print(f"Rendered {show.frame_count} frames ({seconds:g}s) to {path} in {elapsed:.2f}s, "
+          f"{show.frame_count / elapsed:.0f} fps")
+
+def main():
+    # Load LED coordinates and determine NUM_LEDS from them
+    try:
+        with open(COORDS_FILE, 'r') as f:
+            led_coords = np.array(json.load(f), dtype=np.float32)
+    except FileNotFoundError:
+        print(f"Error: Coordinate file not found at {COORDS_FILE}")
+        exit(1)
+    num_leds = len(led_coords)
+
+    if len(sys.argv) > 1:
+        if len(sys.argv) < 3:
+            print("Usage: python fire.py [<show file> <seconds> [compress]]")
+            exit(1)
+        render_to_file(led_coords, sys.argv[1], float(sys.argv[2]), "compress" in sys.argv[3:])
+        return
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = FrameSender(sock, (UDP_IP, UDP_PORT), FRAME_ENCODING, latency=PRESENTATION_LATENCY,
+                         source=LAYER_SOURCE, blend=LAYER_BLEND, max_fps=FRAME_RATE)
+
+    frame = FrameBuffer(num_leds)
+    fire = FireEffect(led_coords)
+    print("Starting fire effect. Press Ctrl+C to stop.")
+    # Frames are due on a fixed schedule, whatever rendering takes; the rate
+    # drops below FRAME_RATE if the Pi can't keep up
+    clock = FrameClock(FRAME_RATE, STATS_LOG_INTERVAL)
+    try:
+        while True:
+            current_time = clock.tick(sender.frame_interval)
+
+            # Render the frame and send it straight from the frame buffer
+            fire.render(current_time, frame)
+            sender.send(frame.commit())
+
+    except KeyboardInterrupt:
+        print("Stopped by user")
+    except Exception as e:
+        print("Error:", e)
+    finally:
+        # Send a final black frame to turn off all LEDs
+        print("Turning off LEDs.")
+        frame.clear()
+        sender.send(frame.commit())
+        sock.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,51 @@
-import sounddevice as sd
+try:
+    import sounddevice as sd
+except ImportError:
+    # only needed for live input; offline renders read a WAV file
+    sd = None
 import socket
 import json
 import colorsys
 import random
 import numpy as np
 import time
-import math
 from collections import deque
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_protocol import FrameSender
+from led_audio import CallbackStats, FeatureRing, SenderThread, ShowRecorder, SpectralAnalyzer, WavReader, offline_blocks
+from led_effects import load_coordinates
+from led_render import FlashKernels, FrameBuffer, FrameClock, VirtualClock
+from led_show import ShowWriter
 
 # =============================
 # CONFIGURATION
 # =============================
 UDP_IP = "192.168.1.107"
 UDP_PORT = 5005
+FRAME_ENCODING = "delta"  # "raw", "rle" or "delta", see led_protocol.py
+PRESENTATION_LATENCY = 0.1  # seconds from sending a frame to the Pi showing it; must cover Wi-Fi jitter
+LAYER_SOURCE = 1  # layer on the Pi, higher is drawn on top; drawn over a background source such as fire.py or an on-Pi effect
+LAYER_BLEND = "add"  # "replace", "alpha", "add" or "max", see led_protocol.BLEND_MODES
+RENDER_RATE = 60  # times per second the audio blocks are processed; frames are only sent on ticks
+STATS_LOG_INTERVAL = 10.0  # seconds between audio callback and render loop timing lines
 
 NUM_LEDS = 50
 
+# Flashes fade with distance along the string, or with FLASH_3D with the
+# distance on the tree itself, from the calibrated coordinates
+FLASH_3D = False
+COORDS_FILE = "savedata_adjusted.json"
+
 # =============================
 # DEVICE SELECTION
 # =============================
 def select_input_device():
+    if sd is None:
+        print("sounddevice is not installed; it is needed for live input")
+        exit(1)
     print("Available input devices:")
     devices = sd.query_devices()
     for i, d in enumerate(devices):
@@ -35,69 +61,26 @@ def select_input_device():
         print(f"Invalid selection: {e}")
         exit(1)
 
-SYSTEM_AUDIO_INDEX = select_input_device()
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-samplerate = 44100
 # Use a smaller hop for lower latency / more responsiveness
 win_s = 1024
 hop_s = 256   # was 512
 
-# Keep a shorter energy history so average reacts faster
-energy_history = []
-
-# track previous short-term energy to detect sudden rises
-prev_energy = 0.0
-
-def strong_beat_detected(mono, energy, average_energy):
+def apply_fade_trail(frame, new_level, fade_factor=0.5):
     """
-    Strong beat if energy is considerably above recent average OR
-    if energy jump (derivative) is large.
-    """
-    global prev_energy
-    energy_ratio = energy / (average_energy + 1e-9)
-    energy_deriv = energy - prev_energy
-    prev_energy = energy
-    # thresholds tuned for responsiveness:
-    return (energy_ratio > 1.7) or (energy_deriv > 0.03)
-
-def is_beat_detected(energy, avg_energy):
-    """Determines if the current energy constitutes a moderate beat."""
-    return energy > 1.2 * avg_energy
-
-def averageEnergy(mono_chunk, RMS_energy):
-    global energy_history
-
-    energy_history.append(RMS_energy)
-    # shorter window to adapt faster to changes
-    max_len = 20
-    if len(energy_history) > max_len:
-        energy_history.pop(0)
-
-    average = np.mean(energy_history)
-    return average
-
-def apply_fade_trail(prev_frame, new_frame, fade_factor=0.5):
-    """
-    Combines previous frame with new frame to create a fading trail.
+    Blends new_level into the frame's level in place to create a fading trail.
     fade_factor: amount of previous frame to keep (0 → none, 1 → fully persistent)
     Lower fade_factor => faster decay (more responsive).
     """
-    frame = []
-    for old, new in zip(prev_frame, new_frame):
-        r = int(fade_factor * old[0] + (1 - fade_factor) * new[0])
-        g = int(fade_factor * old[1] + (1 - fade_factor) * new[1])
-        b = int(fade_factor * old[2] + (1 - fade_factor) * new[2])
-        frame.append([r, g, b])
-    return frame
-
-def flash(frame, intensity=1.0):
+    frame.fade(fade_factor)
+    frame.level += (1 - fade_factor) * new_level
+    np.floor(frame.level, out=frame.level)
+
+def flash(frame, kernels, intensity=1.0):
     """
-    Create a short, bright flash with spatial falloff.
+    Draw a short, bright flash with spatial falloff into frame, from kernels (FlashKernels).
     intensity: 0.0..n - scales brightness
     """
-    new_frame = [[0,0,0] for _ in range(len(frame))]
+    frame.clear()
     # choose one or a few impact points for variety
     centers = [random.randint(0, len(frame)-1) for _ in range(random.choice([1,1,2]))]
     base_color = [random.randint(150, 255), random.randint(80, 220), random.randint(0, 120)]
@@ -105,22 +88,12 @@ def flash(frame, intensity=1.0):
     for c in centers:
         # scale controls how quickly it fades across LEDs
         scale = max(3, int(5 - intensity))  # stronger beats are tighter
-        for i in range(len(frame)):
-            dist = abs(i - c)
-            # gaussian-like falloff
-            fall = math.exp(- (dist**2) / (2 * (scale**2)))
-            brightness = min(1.0, intensity * fall)
-            r = int(base_color[0] * brightness)
-            g = int(base_color[1] * brightness)
-            b = int(base_color[2] * brightness)
-            # additive so multiple centers can stack
-            new_frame[i][0] = min(255, new_frame[i][0] + r)
-            new_frame[i][1] = min(255, new_frame[i][1] + g)
-            new_frame[i][2] = min(255, new_frame[i][2] + b)
-
-    return new_frame
-
-prev_frame = [[0, 0, 0] for _ in range(NUM_LEDS)]
+        # gaussian-like falloff; additive so multiple centers can stack
+        kernels.add(frame.level, c, scale, base_color, intensity)
+
+led_frame = FrameBuffer(NUM_LEDS)
+# Falloff kernels are cached, so a flash costs a shifted add, not an exp() per LED
+flash_kernels = FlashKernels(NUM_LEDS, load_coordinates(NUM_LEDS, COORDS_FILE) if FLASH_3D else None)
 
 # --- Tempo / metronome state ---
 onset_times = deque(maxlen=32)
@@ -175,16 +148,12 @@ def schedule_and_emit_metronome(now, energy):
     if next_tick == 0.0:
         next_tick = now + interval
 
-    # If an onset is close to the next tick, align phase
-    # (Don't create a flash here — we'll flash at the aligned tick below)
-    if abs(now - next_tick) < ALIGN_TOLERANCE:
-        next_tick = now + interval
-
     # Emit ticks for any overdue intervals (catch up)
     while now >= next_tick:
         # Create the flash for this tick; intensity can be derived from recent energy
         intensity = max(0.6, min(2.5, (energy * 5.0)))  # scale energy to intensity
-        frame = flash([[0,0,0]] * NUM_LEDS, intensity=intensity)
+        flash(led_frame, flash_kernels, intensity=intensity)
+        frame = led_frame
         last_flash_time = now
         last_sent_black = False
         sent = True
@@ -193,50 +162,48 @@ def schedule_and_emit_metronome(now, energy):
     return sent, frame
 
 def audio_callback(indata, frames, time_info, status):
-
-    global prev_frame, last_onset_time, last_flash_time, last_sent_black
-
-    if status:
-        print("Audio status:", status)
-
-    now = time.time()
+    # Runs on the audio thread and must finish well within one block
+    # (hop_s samples): measure the block and hand it to the render loop
+    start = time.perf_counter()
     mono = np.mean(indata, axis=1).astype('float32') # collapses stereo to mono
+    analyze_block(mono, time.time())
+    callback_stats.record(start, status)
 
+def analyze_block(mono, now):
     energy = np.sqrt(np.mean(mono**2)) # RMS energy
-    avgEnergy = averageEnergy(mono, energy)
+    analyzer.process(mono)
+    features.push(now, energy, analyzer.onset, analyzer.strength, *analyzer.bands)
+
+def process_block(now, energy, onset):
+    """Tracks onsets and the metronome for one audio block, handing any frame to the sender thread."""
+    global last_onset_time, last_flash_time, last_sent_black, next_tick
 
     # Update onset list if a strong onset detected (used for BPM estimation)
-    if strong_beat_detected(mono, energy, avgEnergy):
+    if onset:
         if (now - last_onset_time) > MIN_ONSET_INTERVAL:
             onset_times.append(now)
             last_onset_time = now
             estimate_bpm_from_onsets()
             # Align phase if this onset is very close to the expected tick
             if bpm != 0.0 and abs(now - next_tick) < ALIGN_TOLERANCE:
-                # snap next tick to now and advance
-                next_tick = now + (60.0 / bpm)
+                # snap the tick to the onset; it fires below and advances by one interval
+                next_tick = now
 
     # Only flash on metronome ticks (not on every onset)
     should_send, frame = schedule_and_emit_metronome(now, energy)
 
-    # If a tick was emitted, send it and ensure a black frame gets sent shortly after
+    # If a tick was emitted, send it and ensure a black frame gets sent shortly after.
+    # Frames are stamped with the block's time, so they show in time with the
+    # music however late the render loop got to them
     if should_send and frame is not None:
-        packet = bytearray([int(c) for color in frame for c in color])
-        try:
-            sock.sendto(packet, (UDP_IP, UDP_PORT))
-        except Exception as e:
-            print("UDP send error:", e)
+        output.submit(frame.commit(), now)
         last_sent_black = False
         return
 
     # If enough time has passed since last flash, send a single black frame and then stop
     if (last_flash_time != 0.0) and (now - last_flash_time > CLEAR_AFTER) and (not last_sent_black):
-        black_frame = [[0, 0, 0] for _ in range(NUM_LEDS)]
-        packet = bytearray([int(c) for color in black_frame for c in color])
-        try:
-            sock.sendto(packet, (UDP_IP, UDP_PORT))
-        except Exception as e:
-            print("UDP send error:", e)
+        led_frame.clear()
+        output.submit(led_frame.commit(), now)
         last_sent_black = True
         # reset last_flash_time so we don't repeatedly clear
         last_flash_time = 0.0
@@ -244,18 +211,81 @@ def audio_callback(indata, frames, time_info, status):
 
     # Otherwise do nothing (no packet) — metronome-only behavior
     return
-# --- Main Loop ---
-print("Starting music-reactive lights. Press Ctrl+C to stop.")
-try:
-    # get audio stream from system audio index
-    with sd.InputStream(device=SYSTEM_AUDIO_INDEX,
-                        channels=1, # 1 channel (stereo to mono as spatial sound isn't necessary)
-                        samplerate=samplerate,
-                        blocksize=hop_s,
-                        callback=audio_callback): # audio_callack is called when a new block of audio is available
-        while True:
-            time.sleep(1)
-except KeyboardInterrupt:
-    print("Stopped by user")
-except Exception as e:
-    print("Error:", e)
\ No newline at end of file
+
+def render_to_file(path, compress=False):
+    """Runs the WAV file through the same analysis and metronome as live input into a show file."""
+    global output
+    started = time.perf_counter()
+    with ShowWriter(path, NUM_LEDS, RENDER_RATE, compress) as show:
+        output = ShowRecorder(show)
+        for t, blocks in offline_blocks(wav, hop_s, VirtualClock(RENDER_RATE)):
+            for now, block in blocks:
+                analyze_block(block, now)
+            for now, energy, onset, *_ in features.drain():
+                process_block(now, energy, onset)
+            output.write()
+    elapsed = time.perf_counter() - started
+    print(f"Rendered {show.frame_count} frames ({wav.duration:.1f}s of audio, {bpm:.0f} BPM at the end) to {path} "
+          f"in {elapsed:.2f}s, {show.frame_count / elapsed:.0f} fps")
+
+if __name__ == "__main__":
+    # Usage: python pc_server.py                                     react to an audio input live
+    #        python pc_server.py <song.wav> <show file> [compress]   render the song offline into a show file
+    #                                                                for play_show.py (at RENDER_RATE fps), as fast as possible
+    OFFLINE = len(sys.argv) > 1
+    if OFFLINE and len(sys.argv) < 3:
+        print("Usage: python pc_server.py [<song.wav> <show file> [compress]]")
+        exit(1)
+
+    if OFFLINE:
+        wav = WavReader(sys.argv[1])
+        samplerate = wav.samplerate
+        # The same random choices on every run, so renders can be compared between versions
+        random.seed(0)
+    else:
+        SYSTEM_AUDIO_INDEX = select_input_device()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender = FrameSender(sock, (UDP_IP, UDP_PORT), FRAME_ENCODING, latency=PRESENTATION_LATENCY,
+                             source=LAYER_SOURCE, blend=LAYER_BLEND)
+
+        samplerate = 44100
+
+    # Onsets (drum hits, notes) from the spectral flux of a win_s-sample window moved
+    # on every hop_s-sample block; also gives bass/mid/treble band energies
+    analyzer = SpectralAnalyzer(samplerate, win_s)
+
+    # audio callback -> features -> render loop (main thread) -> output (sender thread)
+    features = FeatureRing(4 + len(analyzer.bands))
+
+    if OFFLINE:
+        render_to_file(sys.argv[2], "compress" in sys.argv[3:])
+        exit(0)
+
+    callback_stats = CallbackStats(hop_s, samplerate)
+    output = SenderThread(sender, NUM_LEDS)
+
+    # --- Main Loop ---
+    print("Starting music-reactive lights. Press Ctrl+C to stop.")
+    try:
+        # get audio stream from system audio index
+        with sd.InputStream(device=SYSTEM_AUDIO_INDEX,
+                            channels=1, # 1 channel (stereo to mono as spatial sound isn't necessary)
+                            samplerate=samplerate,
+                            blocksize=hop_s,
+                            callback=audio_callback): # audio_callack is called when a new block of audio is available
+            clock = FrameClock(RENDER_RATE, STATS_LOG_INTERVAL, "Render loop")
+            next_log = time.perf_counter() + STATS_LOG_INTERVAL
+            while True:
+                clock.tick()
+                for now, energy, onset, *_ in features.drain():
+                    process_block(now, energy, onset)
+
+                now = time.perf_counter()
+                if now >= next_log:
+                    print(callback_stats.log_line())
+                    next_log = now + STATS_LOG_INTERVAL
+    except KeyboardInterrupt:
+        print("Stopped by user")
+    except Exception as e:
+        print("Error:", e)
\ No newline at end of file
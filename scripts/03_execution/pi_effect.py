@@ -0,0 +1,43 @@
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_protocol import effect_message
+
+# =============================
+# CONFIGURATION
+# =============================
+UDP_IP = "192.168.1.107"
+UDP_PORT = 5005
+# Control packets are idempotent, so send a few in case Wi-Fi drops one
+REPEATS = 3
+
+# Usage: python pi_effect.py <effect> [name=value ...]
+#   python pi_effect.py fire speed=0.8 palette=ice brightness=0.5
+#   python pi_effect.py rainbow twist=2 fps=60
+#   python pi_effect.py off
+# Effects and their parameters are in scripts/RPi/led_effects.py. Values are
+# read as JSON where possible, so palette=[[0,0,0,0],[1,255,0,0]] works too.
+if len(sys.argv) < 2:
+    print("Usage: python pi_effect.py <fire|rainbow|sparkle|off> [name=value ...]")
+    exit(1)
+
+name = sys.argv[1]
+params = {}
+for arg in sys.argv[2:]:
+    key, _, value = arg.partition("=")
+    try:
+        params[key] = json.loads(value)
+    except ValueError:
+        params[key] = value
+
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+message = effect_message(name, params)
+for _ in range(REPEATS):
+    sock.sendto(message, (UDP_IP, UDP_PORT))
+    time.sleep(0.05)
+sock.close()
+print(f"Sent {name} {params} to {UDP_IP}:{UDP_PORT}")
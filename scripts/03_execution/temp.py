@@ -1,24 +1,50 @@
-import sounddevice as sd
+try:
+    import sounddevice as sd
+except ImportError:
+    # only needed for live input; offline renders read a WAV file
+    sd = None
 import socket
 import json
 import colorsys
 import random
 import numpy as np
 import time
-import math
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_protocol import FrameSender
+from led_audio import CallbackStats, FeatureRing, SenderThread, ShowRecorder, SpectralAnalyzer, WavReader, offline_blocks
+from led_effects import load_coordinates
+from led_render import FlashKernels, FrameBuffer, FrameEffect, FrameClock, VirtualClock, hue_to_rgb
+from led_show import ShowWriter
 
 # =============================
 # CONFIGURATION
 # =============================
 UDP_IP = "192.168.1.107"
 UDP_PORT = 5005
+FRAME_ENCODING = "delta"  # "raw", "rle" or "delta", see led_protocol.py
+PRESENTATION_LATENCY = 0.1  # seconds from sending a frame to the Pi showing it; must cover Wi-Fi jitter
+LAYER_SOURCE = 1  # layer on the Pi, higher is drawn on top; drawn over a background source such as fire.py or an on-Pi effect
+LAYER_BLEND = "add"  # "replace", "alpha", "add" or "max", see led_protocol.BLEND_MODES
+MAX_FRAME_RATE = 30  # frames per second sent at most; the Pi's feedback lowers it when it can't keep up
+STATS_LOG_INTERVAL = 10.0  # seconds between audio callback and render loop timing lines
 
 NUM_LEDS = 800
 
+# Flashes fade with distance along the string, or with FLASH_3D with the
+# distance on the tree itself, from the calibrated coordinates
+FLASH_3D = False
+COORDS_FILE = "savedata_adjusted.json"
+
 # =============================
 # DEVICE SELECTION
 # =============================
 def select_input_device():
+    if sd is None:
+        print("sounddevice is not installed; it is needed for live input")
+        exit(1)
     print("Available input devices:")
     devices = sd.query_devices()
     for i, d in enumerate(devices):
@@ -34,168 +60,182 @@ def select_input_device():
         print(f"Invalid selection: {e}")
         exit(1)
 
-SYSTEM_AUDIO_INDEX = select_input_device()
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-samplerate = 44100
 # Use a smaller hop for lower latency / more responsiveness
 win_s = 1024
 hop_s = 256   # was 512
 
-# Keep a shorter energy history so average reacts faster
-energy_history = []
-
-# track previous short-term energy to detect sudden rises
-prev_energy = 0.0
-
 # --- State for flash hold ---
-led_buffer = np.zeros((NUM_LEDS, 3), dtype=float)
-last_send_time = 0.0
+led_frame = FrameBuffer(NUM_LEDS)
 
-def strong_beat_detected(mono, energy, average_energy):
-    """
-    Strong beat if energy is considerably above recent average OR
-    if energy jump (derivative) is large.
+class BeatLights(FrameEffect):
     """
-    global prev_energy
-    energy_ratio = energy / (average_energy + 1e-9)
-    energy_deriv = energy - prev_energy
-    prev_energy = energy
-    # thresholds tuned for responsiveness:
-    return (energy_ratio > 1.7) or (energy_deriv > 0.03)
-
-def is_beat_detected(energy, avg_energy):
-    """Determines if the current energy constitutes a moderate beat."""
-    return energy > 1.2 * avg_energy
-
-def averageEnergy(mono_chunk, RMS_energy):
-    global energy_history
-
-    energy_history.append(RMS_energy)
-    # shorter window to adapt faster to changes
-    max_len = 20
-    if len(energy_history) > max_len:
-        energy_history.pop(0)
-
-    average = np.mean(energy_history)
-    return average
-
-def flash(frame, intensity=1.0):
+    Flashes, sparkles and wipes on strong beats, on top of what is already
+    lit, which decays slowly. render() is called for every audio block.
+    Flashes fade along the string, or with coords (the LED positions) by
+    distance on the tree.
     """
-    Create a short, bright flash with spatial falloff.
-    intensity: 0.0..n - scales brightness
-    """
-    new_frame = [[0,0,0] for _ in range(len(frame))]
-    # choose one or a few impact points for variety
-    centers = [random.randint(0, len(frame)-1) for _ in range(random.choice([1,1,2]))]
-
-    # Generate a random vivid color using HSV
-    hue = random.random()
-    rgb = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
-    base_color = [int(c * 255) for c in rgb]
-
-    for c in centers:
-        # scale controls how quickly it fades across LEDs
-        scale = random.randint(15, 40) # Wider flashes
-        for i in range(len(frame)):
-            dist = abs(i - c)
-            # gaussian-like falloff
-            fall = math.exp(- (dist**2) / (2 * (scale**2)))
-            brightness = min(1.0, intensity * fall)
-            r = int(base_color[0] * brightness)
-            g = int(base_color[1] * brightness)
-            b = int(base_color[2] * brightness)
-            # additive so multiple centers can stack
-            new_frame[i][0] = min(255, new_frame[i][0] + r)
-            new_frame[i][1] = min(255, new_frame[i][1] + g)
-            new_frame[i][2] = min(255, new_frame[i][2] + b)
-
-    return new_frame
-
-def sparkle(frame, intensity=1.0):
-    """Random LEDs light up."""
-    new_frame = [[0,0,0] for _ in range(len(frame))]
-    # Density depends on intensity
-    count = int(len(frame) * (0.1 + 0.1 * min(3.0, intensity)))
-    brightness = min(1.0, intensity)
-    
-    for _ in range(count):
-        idx = random.randint(0, len(frame)-1)
+
+    def __init__(self, num_leds, coords=None):
+        # Each beat's effect is drawn here, then added to the frame
+        self.burst = np.zeros((num_leds, 3), dtype=np.float32)
+        # Falloff kernels are cached, so a flash costs a shifted add, not an exp() per LED
+        self.kernels = FlashKernels(num_leds, coords)
+
+    def render(self, t, frame):
+        # Decay the current state slowly so LEDs stay on longer
+        frame.fade(0.92)
+
+    def beat(self, frame, intensity, effect=None):
+        """Adds effect (flash, sparkle or wipe; a random one by default) to frame."""
+        if effect is None:
+            effect = random.choice([self.flash, self.flash, self.sparkle, self.wipe])
+        self.burst.fill(0.0)
+        effect(frame, intensity=intensity)
+        # Add the new effect on top of the existing buffer
+        frame.level += self.burst
+
+    def flash(self, frame, intensity=1.0):
+        """
+        Draw a short, bright flash with spatial falloff into the burst.
+        intensity: 0.0..n - scales brightness
+        """
+        # choose one or a few impact points for variety
+        centers = [random.randint(0, len(frame)-1) for _ in range(random.choice([1,1,2]))]
+
+        # Generate a random vivid color using HSV
         hue = random.random()
         rgb = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
-        new_frame[idx] = [int(c * 255 * brightness) for c in rgb]
-    return new_frame
-
-def wipe(frame, intensity=1.0):
-    """Lights up a random segment."""
-    new_frame = [[0,0,0] for _ in range(len(frame))]
-    segment_len = random.randint(100, 400)
-    start = random.randint(0, max(0, len(frame) - segment_len))
-    
-    hue = random.random()
-    rgb = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
-    brightness = min(1.0, intensity)
-    base_color = [int(c * 255 * brightness) for c in rgb]
-    
-    for i in range(segment_len):
-        if start + i < len(frame):
-            new_frame[start+i] = base_color
-    return new_frame
+        base_color = [int(c * 255) for c in rgb]
 
-def audio_callback(indata, frames, time_info, status):
+        for c in centers:
+            # scale controls how quickly it fades across LEDs
+            scale = random.randint(15, 40) # Wider flashes
+            # gaussian-like falloff; additive so multiple centers can stack
+            self.kernels.add(self.burst, c, scale, base_color, intensity)
 
-    global led_buffer, last_send_time
+    def sparkle(self, frame, intensity=1.0):
+        """Random LEDs light up."""
+        # Density depends on intensity
+        count = int(len(frame) * (0.1 + 0.1 * min(3.0, intensity)))
+        brightness = min(1.0, intensity)
 
-    if status:
-        print("Audio status:", status)
+        idx = np.random.randint(0, len(frame), count)
+        self.burst[idx] = np.floor(hue_to_rgb(np.random.random(count)) * (255 * brightness))
 
-    now = time.time()
+    def wipe(self, frame, intensity=1.0):
+        """Lights up a random segment."""
+        segment_len = random.randint(100, 400)
+        start = random.randint(0, max(0, len(frame) - segment_len))
+
+        hue = random.random()
+        rgb = colorsys.hsv_to_rgb(hue, 1.0, 1.0)
+        brightness = min(1.0, intensity)
+        self.burst[start:start + segment_len] = [int(c * 255 * brightness) for c in rgb]
+
+def audio_callback(indata, frames, time_info, status):
+    # Runs on the audio thread and must finish well within one block
+    # (hop_s samples): measure the block and hand it to the render loop
+    start = time.perf_counter()
     mono = np.mean(indata, axis=1).astype('float32') # collapses stereo to mono
+    analyze_block(mono, time.time())
+    callback_stats.record(start, status)
 
+def analyze_block(mono, now):
     energy = np.sqrt(np.mean(mono**2)) # RMS energy
-    avgEnergy = averageEnergy(mono, energy)
-
-    # Decay the current state slowly so LEDs stay on longer
-    led_buffer *= 0.92
-
-    # compute intensity proportional to how strong the beat is
-    intensity = max(0.3, min(3.0, (energy / (avgEnergy + 1e-9))))
-    if strong_beat_detected(mono, energy, avgEnergy):
-        # stronger beats -> higher intensity and tighter flash
-        intensity_scaled = intensity * 1.2
-        effect = random.choice([flash, flash, sparkle, wipe])
-        effect_frame = effect([[0,0,0]] * NUM_LEDS, intensity=intensity_scaled)
-        
-        # Add the new effect on top of the existing buffer
-        led_buffer += np.array(effect_frame)
-        
-        # Debug print for beat strength (can be commented out)
-        print(f"Flash! energy={energy:.4f} avg={avgEnergy:.4f} ratio={energy/ (avgEnergy+1e-9):.2f}")
-
-    # Limit update rate to ~30 FPS to prevent network/LED flooding
-    if now - last_send_time > 0.033:
-        # Clip to valid range and convert to bytes
-        output_frame = np.clip(led_buffer, 0, 255).astype(int)
-        packet = bytearray([c for pixel in output_frame for c in pixel])
-        try:
-            sock.sendto(packet, (UDP_IP, UDP_PORT))
-        except Exception as e:
-            print("UDP send error:", e)
-        last_send_time = now
-
-# --- Main Loop ---
-print("Starting music-reactive lights. Press Ctrl+C to stop.")
-try:
-    # get audio stream from system audio index
-    with sd.InputStream(device=SYSTEM_AUDIO_INDEX,
-                        channels=1, # 1 channel (stereo to mono as spatial sound isn't necessary)
-                        samplerate=samplerate,
-                        blocksize=hop_s,
-                        callback=audio_callback): # audio_callack is called when a new block of audio is available
-        while True:
-            time.sleep(1)
-except KeyboardInterrupt:
-    print("Stopped by user")
-except Exception as e:
-    print("Error:", e)
\ No newline at end of file
+    analyzer.process(mono)
+    features.push(now, energy, analyzer.onset, analyzer.strength, *analyzer.bands)
+
+def render_frame():
+    """Reacts to every audio block since the last frame, then hands the frame to the sender thread."""
+    for now, energy, onset, strength, bass, mid, treble in features.drain():
+        lights.render(now, led_frame)
+
+        if onset:
+            # intensity proportional to how far the onset rose above the threshold;
+            # stronger beats -> higher intensity and tighter flash
+            intensity = max(0.3, min(3.0, strength))
+            lights.beat(led_frame, intensity * 1.2)
+
+            # Debug print for beat strength (can be commented out)
+            print(f"Flash! energy={energy:.4f} strength={strength:.2f} bass={bass:.4f} mid={mid:.4f} treble={treble:.4f}")
+
+    output.submit(led_frame.commit())
+
+def render_to_file(path, compress=False):
+    """Runs the WAV file through the same analysis and effects as live input into a show file."""
+    global output
+    started = time.perf_counter()
+    with ShowWriter(path, NUM_LEDS, MAX_FRAME_RATE, compress) as show:
+        output = ShowRecorder(show)
+        for t, blocks in offline_blocks(wav, hop_s, VirtualClock(MAX_FRAME_RATE)):
+            for now, block in blocks:
+                analyze_block(block, now)
+            render_frame()
+            output.write()
+    elapsed = time.perf_counter() - started
+    print(f"Rendered {show.frame_count} frames ({wav.duration:.1f}s of audio) to {path} in {elapsed:.2f}s, "
+          f"{show.frame_count / elapsed:.0f} fps")
+
+if __name__ == "__main__":
+    # Usage: python temp.py                                     react to an audio input live
+    #        python temp.py <song.wav> <show file> [compress]   render the song offline into a show
+    #                                                           file for play_show.py, as fast as possible
+    OFFLINE = len(sys.argv) > 1
+    if OFFLINE and len(sys.argv) < 3:
+        print("Usage: python temp.py [<song.wav> <show file> [compress]]")
+        exit(1)
+
+    if OFFLINE:
+        wav = WavReader(sys.argv[1])
+        samplerate = wav.samplerate
+        # The same random choices on every run, so renders can be compared between versions
+        random.seed(0)
+        np.random.seed(0)
+    else:
+        SYSTEM_AUDIO_INDEX = select_input_device()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender = FrameSender(sock, (UDP_IP, UDP_PORT), FRAME_ENCODING, latency=PRESENTATION_LATENCY,
+                             source=LAYER_SOURCE, blend=LAYER_BLEND, max_fps=MAX_FRAME_RATE)
+
+        samplerate = 44100
+
+    # Onsets (drum hits, notes) from the spectral flux of a win_s-sample window moved
+    # on every hop_s-sample block; also gives bass/mid/treble band energies
+    analyzer = SpectralAnalyzer(samplerate, win_s)
+
+    lights = BeatLights(NUM_LEDS, load_coordinates(NUM_LEDS, COORDS_FILE) if FLASH_3D else None)
+    # audio callback -> features -> render loop (main thread) -> output (sender thread)
+    features = FeatureRing(4 + len(analyzer.bands))
+
+    if OFFLINE:
+        render_to_file(sys.argv[2], "compress" in sys.argv[3:])
+        exit(0)
+
+    callback_stats = CallbackStats(hop_s, samplerate)
+    output = SenderThread(sender, NUM_LEDS)
+
+    # --- Main Loop ---
+    print("Starting music-reactive lights. Press Ctrl+C to stop.")
+    try:
+        # get audio stream from system audio index
+        with sd.InputStream(device=SYSTEM_AUDIO_INDEX,
+                            channels=1, # 1 channel (stereo to mono as spatial sound isn't necessary)
+                            samplerate=samplerate,
+                            blocksize=hop_s,
+                            callback=audio_callback): # audio_callack is called when a new block of audio is available
+            clock = FrameClock(MAX_FRAME_RATE, STATS_LOG_INTERVAL, "Render loop")
+            next_log = time.perf_counter() + STATS_LOG_INTERVAL
+            while True:
+                # ~30 FPS to prevent network/LED flooding, less if the Pi can't keep up
+                clock.tick(sender.frame_interval)
+                render_frame()
+
+                now = time.perf_counter()
+                if now >= next_log:
+                    print(callback_stats.log_line())
+                    next_log = now + STATS_LOG_INTERVAL
+    except KeyboardInterrupt:
+        print("Stopped by user")
+    except Exception as e:
+        print("Error:", e)
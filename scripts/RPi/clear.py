@@ -1,28 +1,21 @@
 import sys
 import board, neopixel
 import threading
+from led_topology import load_topology
 
-NUM_LEDS_PER_STRIP = 200
-strip1 = neopixel.NeoPixel(board.D18, NUM_LEDS_PER_STRIP, brightness = 1.0, auto_write=False)
-strip2 = neopixel.NeoPixel(board.D21, NUM_LEDS_PER_STRIP, brightness = 1.0, auto_write=False)
-strip3 = neopixel.NeoPixel(board.D12, NUM_LEDS_PER_STRIP, brightness = 1.0, auto_write=False)
+layouts = load_topology()
+strips = [neopixel.NeoPixel(getattr(board, f"D{layout.pin}"), len(layout.index), brightness = 1.0,
+                            auto_write=False, pixel_order=getattr(neopixel, layout.color_order))
+          for layout in layouts]
 
 def show_all():
-    t1 = threading.Thread(target=strip1.show)
-    t2 = threading.Thread(target=strip2.show)
-    t3 = threading.Thread(target=strip3.show)
+    threads = [threading.Thread(target=strip.show) for strip in strips]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
 
-    t1.start()
-    t2.start()
-    t3.start()
+for strip in strips:
+    strip.fill((0, 0, 0))
 
-    t1.join()
-    t2.join()
-    t3.join()
-
-for i in range(NUM_LEDS_PER_STRIP):
-    strip1[i] = (0, 0, 0)
-    strip2[i] = (0, 0, 0)
-    strip3[i] = (0, 0, 0)
-
-show_all()
\ No newline at end of file
+show_all()
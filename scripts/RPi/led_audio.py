@@ -0,0 +1,271 @@
+import threading
+import time
+import wave
+import numpy as np
+from led_metrics import Histogram
+
+
+class FeatureRing:
+    """
+    Hands per-block audio features from the audio callback to the render
+    loop. The callback push()es one row of width floats per block, the
+    render loop drain()s every row pushed since its last call, oldest first.
+    There is exactly one producer and one consumer and no lock: the
+    producer writes a slot before advancing written, the consumer only
+    advances read. If the consumer falls more than capacity blocks behind,
+    the oldest rows are lost and counted in overruns.
+    """
+
+    def __init__(self, width, capacity=1024):
+        self.rows = np.zeros((capacity, width), dtype=np.float64)
+        self.capacity = capacity
+        self.written = 0
+        self.read = 0
+        self.overruns = 0
+
+    def push(self, *values):
+        self.rows[self.written % self.capacity] = values
+        self.written += 1
+
+    def drain(self):
+        written = self.written
+        if written - self.read > self.capacity:
+            self.overruns += written - self.read - self.capacity
+            self.read = written - self.capacity
+        start = self.read % self.capacity
+        rows = self.rows.take(range(start, start + written - self.read), axis=0, mode='wrap')
+        self.read = written
+        return rows
+
+
+class SpectralAnalyzer:
+    """
+    Streaming spectrum analysis of a mono input, one hop at a time.
+    process() slides each block of samples into a win-sample window and
+    takes a Hann-windowed real FFT of it, giving the energy in each of bands
+    (bass, mid and treble by default, in Hz) and the spectral flux, the sum
+    of the rises in log magnitude per bin since the previous hop, which
+    peaks when a note or drum hits. A hop is an onset when the flux first
+    rises above the mean plus sensitivity standard deviations of the flux
+    over the last history hops (and at least min_flux, so silence stays
+    quiet); strength is how far above the threshold it is. Buffers are
+    allocated up front; only the FFT allocates its output.
+    """
+
+    BANDS = ((20, 250), (250, 2000), (2000, 8000))
+
+    def __init__(self, samplerate, win=1024, bands=BANDS, history=43, sensitivity=4.0, min_flux=0.03):
+        self.samples = np.zeros(win, dtype=np.float32)
+        self.windowed = np.empty(win, dtype=np.float32)
+        self.hann = np.hanning(win).astype(np.float32)
+        bins = win // 2 + 1
+        self.magnitude = np.zeros(bins, dtype=np.float32)
+        self.previous = np.zeros(bins, dtype=np.float32)
+        self.rise = np.empty(bins, dtype=np.float32)
+        # Scales magnitudes so a full-scale sine peaks at about 1.0
+        self.norm = np.float32(2.0 / self.hann.sum())
+        # One row per band selecting its bins, so band energies are one dot product
+        freqs = np.fft.rfftfreq(win, 1.0 / samplerate)
+        self.band_bins = np.array([(freqs >= low) & (freqs < high) for low, high in bands], dtype=np.float32)
+        self.bands = np.zeros(len(bands), dtype=np.float32)
+
+        self.flux = 0.0
+        self.history = np.zeros(history, dtype=np.float32)
+        self.hops = 0
+        self.sensitivity = sensitivity
+        self.min_flux = min_flux
+        self.threshold = min_flux
+        self.above = False
+        self.onset = False
+        self.strength = 0.0
+
+    def process(self, block):
+        """Analyses the next block of samples; returns True if it holds an onset."""
+        n = len(block)
+        self.samples[:-n] = self.samples[n:]
+        self.samples[-n:] = block
+        np.multiply(self.samples, self.hann, out=self.windowed)
+        np.abs(np.fft.rfft(self.windowed), out=self.magnitude)
+        self.magnitude *= self.norm
+
+        # Band energies from the power spectrum (rise is scratch here)
+        np.square(self.magnitude, out=self.rise)
+        np.dot(self.band_bins, self.rise, out=self.bands)
+
+        # Log compression makes quiet and loud passages comparable
+        np.log1p(self.magnitude * np.float32(100.0), out=self.magnitude)
+        np.subtract(self.magnitude, self.previous, out=self.rise)
+        np.maximum(self.rise, 0.0, out=self.rise)
+        self.flux = float(self.rise.mean())
+        self.magnitude, self.previous = self.previous, self.magnitude
+
+        # Adaptive threshold over the recent flux, not counting this hop
+        filled = self.history[:min(self.hops, len(self.history))]
+        if len(filled):
+            self.threshold = max(float(filled.mean() + self.sensitivity * filled.std()), self.min_flux)
+        self.history[self.hops % len(self.history)] = self.flux
+        self.hops += 1
+
+        above = self.flux > self.threshold
+        self.onset = above and not self.above
+        self.above = above
+        self.strength = self.flux / self.threshold
+        return self.onset
+
+
+class CallbackStats:
+    """
+    Times the audio callback against its budget, the length of one block of
+    audio: a callback that takes longer makes the input overflow. Call
+    record() last thing in the callback with the perf_counter() time it
+    started and its status.
+    """
+
+    def __init__(self, blocksize, samplerate):
+        self.budget = blocksize / samplerate
+        self.durations = Histogram()
+        self.over_budget = 0
+        self.overflows = 0
+
+    def record(self, start, status):
+        duration = time.perf_counter() - start
+        self.durations.record(duration)
+        if duration > self.budget:
+            self.over_budget += 1
+        if status and status.input_overflow:
+            self.overflows += 1
+
+    def log_line(self):
+        d = self.durations.summary()
+        return (f"Audio callback: p50 {d['p50'] * 1000:.2f}ms p99 {d['p99'] * 1000:.2f}ms "
+                f"max {d['max'] * 1000:.2f}ms of {self.budget * 1000:.1f}ms budget, "
+                f"{self.over_budget} over budget, {self.overflows} input overflows")
+
+
+class SenderThread:
+    """
+    Sends frames for the render loop on a thread of its own, so network
+    stalls never hold up rendering. submit() copies the frame and returns
+    at once; a frame submitted before the previous one went out replaces it
+    (counted in superseded). timestamp is passed on to FrameSender.send().
+    """
+
+    def __init__(self, sender, num_pixels):
+        self.sender = sender
+        # One buffer being sent, the other waiting
+        self.buffers = [bytearray(num_pixels * 3), bytearray(num_pixels * 3)]
+        self.sending = 0
+        self.pending = None  # timestamp of the waiting frame, or None
+        self.has_pending = False
+        self.busy = False  # a frame is being sent
+        self.superseded = 0
+        self.errors = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, pixels, timestamp=None):
+        with self.condition:
+            if self.has_pending:
+                self.superseded += 1
+            self.buffers[1 - self.sending][:] = pixels
+            self.pending = timestamp
+            self.has_pending = True
+            self.condition.notify()
+
+    def flush(self, timeout=1.0):
+        """Waits until the last submitted frame has been sent."""
+        with self.condition:
+            self.condition.wait_for(lambda: not self.has_pending and not self.busy, timeout)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.has_pending)
+                self.sending = 1 - self.sending
+                timestamp = self.pending
+                self.has_pending = False
+                self.busy = True
+            try:
+                self.sender.send(self.buffers[self.sending], timestamp)
+            except Exception as e:
+                self.errors += 1
+                print("UDP send error:", e)
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+
+class ShowRecorder:
+    """
+    Offline stand-in for SenderThread: submit() keeps the latest frame and
+    write() appends it to show, a led_show.ShowWriter, once per frame of the
+    show, so a frame stays up until the next one is submitted as it does on
+    the Pi.
+    """
+
+    def __init__(self, show):
+        self.show = show
+        self.pixels = bytearray(show.frame_size)
+
+    def submit(self, pixels, timestamp=None):
+        self.pixels[:] = pixels
+
+    def write(self):
+        self.show.write(self.pixels)
+
+
+class WavReader:
+    """
+    A PCM WAV file (8, 16, 24 or 32 bit, any number of channels) as mono
+    float32 samples from -1.0 to 1.0, to drive the audio effects offline
+    instead of a live input.
+    """
+
+    def __init__(self, path):
+        with wave.open(path, 'rb') as f:
+            self.samplerate = f.getframerate()
+            channels = f.getnchannels()
+            width = f.getsampwidth()
+            data = f.readframes(f.getnframes())
+        if width == 1:
+            samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif width == 3:
+            # Little-endian 24 bit: put each sample in the top of an int32
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+            padded = np.zeros((len(raw), 4), dtype=np.uint8)
+            padded[:, 1:] = raw
+            samples = padded.view('<i4').ravel().astype(np.float32) / 2 ** 31
+        elif width in (2, 4):
+            dtype = '<i2' if width == 2 else '<i4'
+            samples = np.frombuffer(data, dtype=dtype).astype(np.float32) / 2 ** (8 * width - 1)
+        else:
+            raise ValueError(f"{path}: unsupported sample width of {width} bytes")
+        self.samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.samplerate
+
+
+def offline_blocks(wav, hop, clock):
+    """
+    Runs a WavReader's audio against a virtual frame clock (led_render.
+    VirtualClock): yields (t, blocks) for frame after frame, t being the
+    frame's time from the start of the file and blocks a list of (time,
+    samples) for each hop-sample block that ended since the previous frame,
+    so an effect sees exactly the audio it would have seen live. Ends after
+    the frame that gets the last block.
+    """
+    total = len(wav.samples)
+    offset = 0
+    while offset < total:
+        t = clock.tick()
+        blocks = []
+        while offset < total and (offset + hop) / wav.samplerate <= t:
+            block = wav.samples[offset:offset + hop]
+            if len(block) < hop:
+                block = np.pad(block, (0, hop - len(block)))
+            offset += hop
+            blocks.append((offset / wav.samplerate, block))
+        yield t, blocks
@@ -0,0 +1,110 @@
+import socket
+import threading
+import time
+
+try:
+    import serial
+except ImportError:
+    # pyserial is only needed with a Pico on the UART
+    serial = None
+
+
+class Controls:
+    """
+    Parameter updates ("delay", "brightness", "effect", ...) from control
+    inputs running on their own threads, handed to the render loop in one
+    piece. set() may be called from any thread. The render loop registers
+    the Controls with its selector (it has a fileno()) and, when it is
+    readable, calls take() to get every change since the last take(); a
+    parameter set twice in between only reports its latest value.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changes = {}
+        # Writing a byte wakes the render loop's select()
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+
+    def fileno(self):
+        return self.wake_recv.fileno()
+
+    def set(self, name, value):
+        with self.lock:
+            notify = not self.changes
+            self.changes[name] = value
+        if notify:
+            try:
+                self.wake_send.send(b"\0")
+            except BlockingIOError:
+                pass  # a wake-up is already pending
+
+    def take(self):
+        # Drain the wake-ups first, so a set() racing with us wakes the loop again
+        try:
+            while self.wake_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self.lock:
+            changes, self.changes = self.changes, {}
+        return changes
+
+
+class UartControl:
+    """
+    Reads the Pico's messages from the UART on a background thread, so the
+    frame path never touches the serial port:
+
+        D:<voltage>   potentiometer, 0-3.3V; sets pot_target ("delay",
+                      scaled to 0..max_delay seconds, or "brightness", 0..1)
+        btn:pressed   selects the next of button_effects as "effect"
+    """
+
+    POT_TARGETS = ("delay", "brightness")
+
+    def __init__(self, controls, port="/dev/serial0", baudrate=9600, pot_target="delay",
+                 max_delay=1.0, button_effects=("off",)):
+        if serial is None:
+            raise RuntimeError("pyserial is not installed")
+        if pot_target not in self.POT_TARGETS:
+            raise ValueError(f"pot_target must be one of {self.POT_TARGETS}, not {pot_target!r}")
+        self.controls = controls
+        self.pot_target = pot_target
+        self.max_delay = max_delay
+        self.button_effects = list(button_effects)
+        self.effect_index = 0
+        self.last_pot = None
+        self.ser = serial.Serial(port, baudrate, timeout=1)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                line = self.ser.readline()
+            except serial.SerialException as e:
+                print(f"Serial read error: {e}")
+                time.sleep(1.0)
+                continue
+            if line:
+                self.handle(line.decode('utf-8', errors='ignore').strip())
+
+    def handle(self, line):
+        if line.startswith("D:"):
+            try:
+                voltage = float(line[2:])
+            except ValueError:
+                return
+            fraction = min(max(voltage / 3.3, 0.0), 1.0)
+            # The Pico reports five times a second whether or not the knob moved
+            if fraction == self.last_pot:
+                return
+            self.last_pot = fraction
+            if self.pot_target == "delay":
+                self.controls.set("delay", fraction * self.max_delay)
+            else:
+                self.controls.set("brightness", fraction)
+        elif line == "btn:pressed" and self.button_effects:
+            self.effect_index = (self.effect_index + 1) % len(self.button_effects)
+            self.controls.set("effect", self.button_effects[self.effect_index])
@@ -0,0 +1,249 @@
+import colorsys
+import json
+import math
+import os
+import time
+import numpy as np
+
+# Calibrated LED positions, copied next to the server (see README)
+COORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "savedata_adjusted.json")
+
+DEFAULT_FPS = 30
+
+# Gradient stops (position, (r, g, b)) for the named palettes. "fire" is the
+# heat_to_color() ramp from scripts/03_execution/fire.py.
+PALETTE_STOPS = {
+    "fire": [(0.0, (0, 0, 0)), (0.2, (60, 0, 0)), (0.5, (255, 0, 0)), (0.8, (255, 255, 0)), (1.0, (255, 255, 255))],
+    "ice": [(0.0, (0, 0, 0)), (0.4, (0, 0, 255)), (0.8, (0, 255, 255)), (1.0, (255, 255, 255))],
+    "forest": [(0.0, (0, 0, 0)), (0.5, (0, 160, 0)), (1.0, (180, 255, 0))],
+    "white": [(0.0, (0, 0, 0)), (1.0, (255, 255, 255))],
+    "rainbow": [(h / 12, tuple(int(c * 255) for c in colorsys.hsv_to_rgb(h / 12, 1.0, 1.0))) for h in range(13)],
+}
+
+
+def load_coordinates(num_pixels, path=COORDS_FILE):
+    """
+    Returns (num_pixels, 3) float32 LED positions from the coordinate file.
+    Pixels the file does not cover (e.g. strips added after calibration)
+    are spread along a vertical line through the middle of the tree so
+    effects still light them.
+    """
+    coords = np.zeros((num_pixels, 3), dtype=np.float32)
+    try:
+        with open(path, 'r') as f:
+            known = np.array(json.load(f), dtype=np.float32)[:num_pixels]
+    except FileNotFoundError:
+        print(f"Coordinate file not found at {path}, using a straight line")
+        known = np.zeros((0, 3), dtype=np.float32)
+    coords[:len(known)] = known
+    if len(known) < num_pixels:
+        low, high = (known[:, 1].min(), known[:, 1].max()) if len(known) else (-1.0, 1.0)
+        coords[len(known):, 1] = np.linspace(low, high, num_pixels - len(known))
+    return coords
+
+
+def palette_lut(palette, brightness=1.0):
+    """
+    Builds a (256, 3) uint8 colour lookup table from a palette name or a list
+    of [position, r, g, b] stops, scaled by brightness. Raises ValueError
+    for anything else.
+    """
+    if isinstance(palette, str):
+        if palette not in PALETTE_STOPS:
+            raise ValueError(f"Unknown palette {palette!r}, expected one of {sorted(PALETTE_STOPS)}")
+        stops = PALETTE_STOPS[palette]
+    else:
+        try:
+            stops = sorted((float(pos), (float(r), float(g), float(b))) for pos, r, g, b in palette)
+        except (TypeError, ValueError):
+            stops = []
+        if not stops:
+            raise ValueError(f"Palette must be a name or a list of [position, r, g, b] stops, not {palette!r}")
+    positions = [pos for pos, _ in stops]
+    x = np.linspace(0.0, 1.0, 256)
+    lut = np.empty((256, 3), dtype=np.float32)
+    for c in range(3):
+        lut[:, c] = np.interp(x, positions, [color[c] for _, color in stops])
+    return np.clip(lut * brightness, 0, 255).astype(np.uint8)
+
+
+def float_param(name, value):
+    """value of parameter name as a finite float; raises ValueError for anything else (e.g. null from JSON)."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Parameter {name} must be a number, not {value!r}") from None
+    if not math.isfinite(value):
+        raise ValueError(f"Parameter {name} must be finite, not {value!r}")
+    return value
+
+
+class Effect:
+    """
+    Base class for effects rendered on the Pi. defaults lists every
+    parameter the effect accepts; render(t, out) writes the frame for t
+    seconds since the effect started into out, a (num_pixels, 3) uint8
+    array, reusing buffers allocated in __init__.
+    """
+
+    defaults = {"palette": "white", "brightness": 1.0}
+
+    def __init__(self, coords, params):
+        unknown = set(params) - set(self.defaults)
+        if unknown:
+            raise ValueError(f"Unknown parameters {sorted(unknown)}, expected some of {sorted(self.defaults)}")
+        self.params = {**self.defaults, **params}
+        for name, value in self.params.items():
+            if name != "palette":
+                self.params[name] = float_param(name, value)
+        self.lut = palette_lut(self.params["palette"], self.params["brightness"])
+        self.num_pixels = len(coords)
+        # Scratch buffers shared by the subclasses
+        self.value = np.empty(self.num_pixels, dtype=np.float32)
+        self.index = np.empty(self.num_pixels, dtype=np.intp)
+
+    def lookup(self, out):
+        """Maps self.value (0..1) through the palette into out."""
+        np.clip(self.value, 0.0, 1.0, out=self.value)
+        self.value *= 255
+        self.index[:] = self.value
+        np.take(self.lut, self.index, axis=0, out=out)
+
+    def render(self, t, out):
+        raise NotImplementedError
+
+
+class Fire(Effect):
+    """fire.py's rising sine noise, fading out towards the top of the tree."""
+
+    defaults = {**Effect.defaults, "palette": "fire", "speed": 0.6,
+                "scale_x": 1.5, "scale_y": 1.0, "scale_z": 1.5}
+
+    # Frequencies of the three sine waves along x, y and z
+    WAVES = [(0.5, 0.2, 0.3), (1.2, -0.8, 0.7), (2.1, 1.5, -1.3)]
+
+    def __init__(self, coords, params):
+        super().__init__(coords, params)
+        p = self.params
+        x, y, z = coords[:, 0] * p["scale_x"], coords[:, 1] * p["scale_y"], coords[:, 2] * p["scale_z"]
+        # Each wave is sin(phase + rate * t); the per-pixel phase never changes
+        self.phases = [(fx * x + fy * y + fz * z).astype(np.float32) for fx, fy, fz in self.WAVES]
+        self.rates = [-fy * p["scale_y"] * p["speed"] for _, fy, _ in self.WAVES]
+        height = coords[:, 1].max() - coords[:, 1].min() or 1.0
+        falloff = 1.0 - (coords[:, 1] - coords[:, 1].min()) / height
+        # Folds the (sum + 3) / 6 normalisation into the squared falloff
+        self.weight = (falloff ** 2 / 6.0).astype(np.float32)
+        self.wave = np.empty(self.num_pixels, dtype=np.float32)
+
+    def render(self, t, out):
+        self.value.fill(3.0)
+        for phase, rate in zip(self.phases, self.rates):
+            np.add(phase, np.float32(rate * t), out=self.wave)
+            np.sin(self.wave, out=self.wave)
+            self.value += self.wave
+        self.value *= self.weight
+        self.lookup(out)
+
+
+class Rainbow(Effect):
+    """Palette bands moving up the tree; twist winds them around it."""
+
+    defaults = {**Effect.defaults, "palette": "rainbow", "speed": 0.2, "scale": 1.0, "twist": 0.0}
+
+    def __init__(self, coords, params):
+        super().__init__(coords, params)
+        p = self.params
+        y = coords[:, 1]
+        height = y.max() - y.min() or 1.0
+        angle = np.arctan2(coords[:, 2], coords[:, 0]) / (2 * math.pi)
+        self.position = ((y - y.min()) / height * p["scale"] + angle * p["twist"]).astype(np.float32)
+
+    def render(self, t, out):
+        np.subtract(self.position, np.float32(t * self.params["speed"]), out=self.value)
+        np.mod(self.value, 1.0, out=self.value)
+        self.lookup(out)
+
+
+class Sparkle(Effect):
+    """Random LEDs flash a palette colour and fade; density is flashes per LED per second."""
+
+    defaults = {**Effect.defaults, "palette": "ice", "density": 0.3, "fade": 0.4, "seed": 0.0}
+
+    def __init__(self, coords, params):
+        super().__init__(coords, params)
+        self.rng = np.random.default_rng(int(self.params["seed"]) or None)
+        self.level = np.zeros((self.num_pixels, 1), dtype=np.float32)
+        self.color = np.zeros((self.num_pixels, 3), dtype=np.uint8)
+        self.scaled = np.empty((self.num_pixels, 3), dtype=np.float32)
+        self.last_t = 0.0
+
+    def render(self, t, out):
+        dt = max(t - self.last_t, 0.0)
+        self.last_t = t
+        self.level *= np.float32(math.exp(-dt / max(self.params["fade"], 1e-3)))
+        flashes = np.flatnonzero(self.rng.random(self.num_pixels) < self.params["density"] * dt)
+        if len(flashes):
+            self.level[flashes] = 1.0
+            self.color[flashes] = self.lut[self.rng.integers(128, 256, len(flashes))]
+        np.multiply(self.color, self.level, out=self.scaled)
+        out[:] = self.scaled
+
+
+EFFECTS = {"fire": Fire, "rainbow": Rainbow, "sparkle": Sparkle}
+
+
+class EffectEngine:
+    """
+    Renders the selected effect on the Pi so only small control packets
+    (led_protocol.effect_message) cross the network. start() switches
+    effect or, for the running one, updates its parameters without
+    restarting the animation. next_frame is the time.time() the next frame
+    is due; render() returns it as a flat [r,g,b,r,g,b,...] view of frame,
+    a (num_pixels, 3) uint8 array that is reused for every frame.
+    """
+
+    def __init__(self, coords):
+        self.coords = coords
+        self.frame = np.zeros((len(coords), 3), dtype=np.uint8)
+        self.view = memoryview(self.frame).cast("B")
+        self.effect = None
+        self.name = None
+        self.interval = 1.0 / DEFAULT_FPS
+        self.start_time = 0.0
+        self.next_frame = 0.0
+
+    @property
+    def active(self):
+        return self.effect is not None
+
+    def start(self, name, params):
+        """Selects effect name; "off" stops. Raises ValueError for unknown effects or parameters."""
+        if name == "off":
+            self.stop()
+            return
+        if name not in EFFECTS:
+            raise ValueError(f"Unknown effect {name!r}, expected one of {sorted(EFFECTS)} or 'off'")
+        params = dict(params)
+        fps = float_param("fps", params.pop("fps", DEFAULT_FPS))
+        if fps <= 0:
+            raise ValueError("fps must be positive")
+        effect = EFFECTS[name](self.coords, params)
+        now = time.time()
+        if name != self.name:
+            self.start_time = now
+        self.effect = effect
+        self.name = name
+        self.interval = 1.0 / fps
+        self.next_frame = now
+
+    def stop(self):
+        self.effect = None
+        self.name = None
+
+    def render(self, now):
+        self.effect.render(now - self.start_time, self.frame)
+        self.next_frame += self.interval
+        if self.next_frame < now:
+            # Rendering fell behind; drop the missed frames rather than rushing to catch up
+            self.next_frame = now + self.interval
+        return self.view
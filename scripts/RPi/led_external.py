@@ -0,0 +1,228 @@
+import socket
+import struct
+import time
+import uuid
+from led_protocol import Frame
+
+# =============================
+# DDP (Distributed Display Protocol, http://www.3waylabs.com/ddp/)
+# =============================
+# UDP port 4048. A 10 byte header (14 with a timecode) followed by raw
+# channel data:
+#
+#   flags     B   DDP_VERSION in the top bits, DDP_* flags below
+#   sequence  B   low 4 bits, 0 when unused
+#   type      B   data type; 0x01 or 0x0B (RGB, 8 bits per channel)
+#   id        B   destination; 1 is the default output
+#   offset    I   byte offset of the data in the frame
+#   length    H   data length in bytes
+#
+# Packets without DDP_PUSH only fill in the frame; it is shown when a
+# packet with DDP_PUSH arrives, so a frame split over many packets is
+# shown all at once.
+DDP_PORT = 4048
+DDP_HEADER = struct.Struct("!BBBBIH")
+DDP_VERSION = 0x40
+DDP_VERSION_MASK = 0xC0
+DDP_TIMECODE = 0x10
+DDP_QUERY = 0x02
+DDP_PUSH = 0x01
+DDP_TYPES_RGB = (0x00, 0x01, 0x0B)
+DDP_ID_DISPLAY = 1
+DDP_MAX_DATA = 1440  # 480 RGB pixels, the usual DDP packet size
+
+# =============================
+# E1.31 (Streaming ACN)
+# =============================
+# UDP port 5568, one DMX universe of up to 512 channels per packet; we map
+# consecutive universes onto consecutive runs of pixels. Data packets with
+# a sync address are held until the E1.31 sync packet for that address.
+E131_PORT = 5568
+E131_ACN_ID = b"ASC-E1.17\x00\x00\x00"
+E131_VECTOR_ROOT_DATA = 0x00000004
+E131_VECTOR_ROOT_EXTENDED = 0x00000008
+E131_VECTOR_DATA = 0x00000002
+E131_VECTOR_SYNC = 0x00000001
+E131_OPTION_TERMINATED = 0x40
+E131_OPTION_PREVIEW = 0x80
+E131_HEADER_SIZE = 126  # up to and including the DMX start code
+E131_SYNC_SIZE = 49
+E131_PIXELS_PER_UNIVERSE = 170  # 510 of the 512 channels
+
+
+def e131_multicast_group(universe):
+    """Multicast address E1.31 senders use for universe."""
+    return f"239.255.{universe >> 8}.{universe & 0xFF}"
+
+
+class DdpReceiver:
+    """
+    Collects DDP packets into a num_pixels frame. add() returns a Frame
+    (tagged with source, blend and opacity for the compositor) when a
+    packet with the push flag completes one, otherwise None. The frame's
+    pixels are a buffer that the next packets keep writing to, so copy
+    them before calling add() again. Pixels not covered keep their
+    previous colour.
+    """
+
+    def __init__(self, num_pixels, source=0, blend="replace", opacity=255):
+        self.pixels = bytearray(num_pixels * 3)
+        self.layer = (source, blend, opacity)
+        self.dropped = 0  # malformed, unsupported or out of range packets
+
+    def add(self, datagram):
+        if len(datagram) < DDP_HEADER.size:
+            self.dropped += 1
+            return None
+        flags, _, data_type, dest, offset, length = DDP_HEADER.unpack_from(datagram)
+        if flags & DDP_VERSION_MASK != DDP_VERSION or flags & DDP_QUERY:
+            return None
+        start = DDP_HEADER.size + (4 if flags & DDP_TIMECODE else 0)
+        if dest != DDP_ID_DISPLAY or data_type not in DDP_TYPES_RGB or len(datagram) < start + length:
+            self.dropped += 1
+            return None
+        end = min(offset + length, len(self.pixels))
+        if offset < end:
+            self.pixels[offset:end] = datagram[start:start + end - offset]
+        if flags & DDP_PUSH:
+            return Frame(None, time.time(), self.pixels, False, *self.layer)
+        return None
+
+
+def ddp_packets(pixels, max_data=DDP_MAX_DATA):
+    """Splits a flat r,g,b frame into DDP packets, the last one with the push flag."""
+    pixels = bytes(pixels)
+    packets = []
+    offsets = range(0, max(len(pixels), 1), max_data)
+    for n, offset in enumerate(offsets, 1):
+        chunk = pixels[offset:offset + max_data]
+        flags = DDP_VERSION | (DDP_PUSH if n == len(offsets) else 0)
+        packets.append(DDP_HEADER.pack(flags, n & 0x0F, 0x0B, DDP_ID_DISPLAY, offset, len(chunk)) + chunk)
+    return packets
+
+
+class E131Receiver:
+    """
+    Maps E1.31 universes start_universe, start_universe + 1, ... onto
+    pixels_per_universe pixels each of a num_pixels frame. add() returns
+    a Frame like DdpReceiver.add() once a frame is complete: on its sync
+    packet if the sender synchronises universes, otherwise when the last
+    universe of the frame arrives or a universe repeats before that.
+    Preview data and stream-terminated packets are ignored.
+    """
+
+    def __init__(self, num_pixels, start_universe=1, pixels_per_universe=E131_PIXELS_PER_UNIVERSE,
+                 source=0, blend="replace", opacity=255):
+        self.pixels = bytearray(num_pixels * 3)
+        self.start_universe = start_universe
+        self.pixels_per_universe = pixels_per_universe
+        self.num_universes = -(-num_pixels // pixels_per_universe)
+        self.layer = (source, blend, opacity)
+        self.received = set()   # universes written since the last frame
+        self.waiting_sync = None  # sync address the written universes wait for
+        self.dropped = 0
+
+    @property
+    def universes(self):
+        return range(self.start_universe, self.start_universe + self.num_universes)
+
+    def _frame(self):
+        self.received.clear()
+        self.waiting_sync = None
+        return Frame(None, time.time(), self.pixels, False, *self.layer)
+
+    def add(self, datagram):
+        if len(datagram) < E131_SYNC_SIZE or bytes(datagram[4:16]) != E131_ACN_ID:
+            self.dropped += 1
+            return None
+        (root_vector,) = struct.unpack_from("!I", datagram, 18)
+        (vector,) = struct.unpack_from("!I", datagram, 40)
+        if root_vector == E131_VECTOR_ROOT_EXTENDED and vector == E131_VECTOR_SYNC:
+            (sync_address,) = struct.unpack_from("!H", datagram, 45)
+            if self.received and sync_address == self.waiting_sync:
+                return self._frame()
+            return None
+        if root_vector != E131_VECTOR_ROOT_DATA or vector != E131_VECTOR_DATA or len(datagram) < E131_HEADER_SIZE:
+            self.dropped += 1
+            return None
+
+        sync_address, _, options, universe = struct.unpack_from("!HBBH", datagram, 109)
+        (count,) = struct.unpack_from("!H", datagram, 123)
+        if options & (E131_OPTION_PREVIEW | E131_OPTION_TERMINATED) or datagram[125] != 0:
+            return None  # preview data, a stopping source or a non-DMX start code
+        index = universe - self.start_universe
+        if not 0 <= index < self.num_universes:
+            return None
+
+        frame = None
+        if universe in self.received and not sync_address:
+            # The sender started the next frame before we saw the last universe;
+            # copy the finished one, this universe overwrites the buffer
+            frame = Frame(None, time.time(), bytes(self.pixels), False, *self.layer)
+            self.received.clear()
+        start = index * self.pixels_per_universe * 3
+        channels = max(0, min(count - 1, self.pixels_per_universe * 3, len(self.pixels) - start, len(datagram) - E131_HEADER_SIZE))
+        self.pixels[start:start + channels] = datagram[E131_HEADER_SIZE:E131_HEADER_SIZE + channels]
+        self.received.add(universe)
+        if sync_address:
+            self.waiting_sync = sync_address
+        elif frame is None and index == self.num_universes - 1:
+            frame = self._frame()
+        return frame
+
+
+class E131Sender:
+    """
+    Minimal E1.31 source for testing: sends a flat r,g,b frame as
+    consecutive universes, followed by a sync packet if sync_address is set.
+    """
+
+    def __init__(self, sock, host, start_universe=1, pixels_per_universe=E131_PIXELS_PER_UNIVERSE,
+                 sync_address=0, name="led-tree test"):
+        self.sock = sock
+        self.host = host
+        self.start_universe = start_universe
+        self.pixels_per_universe = pixels_per_universe
+        self.sync_address = sync_address
+        self.cid = uuid.uuid4().bytes
+        self.name = name.encode('utf-8')[:63].ljust(64, b"\x00")
+        self.seq = 0
+
+    def _root(self, vector, length):
+        # Root layer; flags and length fields carry 0x7000 in their top bits
+        return (struct.pack("!HH", 0x0010, 0) + E131_ACN_ID
+                + struct.pack("!HI", 0x7000 | (length - 16), vector) + self.cid)
+
+    def packets(self, pixels):
+        pixels = bytes(pixels)
+        size = self.pixels_per_universe * 3
+        packets = []
+        for n, offset in enumerate(range(0, max(len(pixels), 1), size)):
+            data = b"\x00" + pixels[offset:offset + size]
+            length = E131_HEADER_SIZE - 1 + len(data)
+            packets.append(
+                self._root(E131_VECTOR_ROOT_DATA, length)
+                + struct.pack("!HI", 0x7000 | (length - 38), E131_VECTOR_DATA) + self.name
+                + struct.pack("!BHBBH", 100, self.sync_address, self.seq, 0, self.start_universe + n)
+                + struct.pack("!HBBHHH", 0x7000 | (length - 115), 0x02, 0xA1, 0, 1, len(data))
+                + data)
+        if self.sync_address:
+            packets.append(self._root(E131_VECTOR_ROOT_EXTENDED, E131_SYNC_SIZE)
+                           + struct.pack("!HIBHH", 0x7000 | (E131_SYNC_SIZE - 38), E131_VECTOR_SYNC,
+                                         self.seq, self.sync_address, 0))
+        self.seq = (self.seq + 1) & 0xFF
+        return packets
+
+    def send(self, pixels):
+        for packet in self.packets(pixels):
+            self.sock.sendto(packet, (self.host, E131_PORT))
+
+
+def join_e131_multicast(sock, universes):
+    """Subscribes sock to the multicast groups of universes, for senders that do not unicast."""
+    for universe in universes:
+        group = socket.inet_aton(e131_multicast_group(universe))
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, group + socket.inet_aton("0.0.0.0"))
+        except OSError as e:
+            print(f"Could not join multicast group for universe {universe}: {e}")
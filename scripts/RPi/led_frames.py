@@ -0,0 +1,523 @@
+import ctypes
+import threading
+import time
+import numpy as np
+from led_metrics import Histogram
+
+try:
+    from rpi_ws281x import ws
+except ImportError:
+    # Not on the Pi (e.g. running the benchmarks); strip_buffer() is unavailable
+    ws = None
+
+# Latch time the LEDs need after the data (LED_RESET_WAIT_TIME in rpi_ws281x)
+LED_RESET_TIME = 300e-6
+
+
+def strip_buffer(strip):
+    """
+    Returns a writable (num_pixels, 4) uint8 numpy view of the strip's native
+    LED buffer. rpi_ws281x stores each pixel as a uint32 0xWWRRGGBB, so on the
+    little-endian Pi the bytes of a pixel are laid out B, G, R, W.
+    Must be called after strip.begin(), which is when the buffer is allocated.
+    """
+    num_pixels = strip.numPixels()
+    address = int(ws.ws2811_channel_t_leds_get(strip._channel))
+    raw = (ctypes.c_uint32 * num_pixels).from_address(address)
+    return np.frombuffer(raw, dtype=np.uint8).reshape(num_pixels, 4)
+
+
+class ColorCorrection:
+    """
+    Per-channel gamma and white balance, then a current limiter, applied to
+    whole frames. The gamma and white balance are baked into one 768-entry
+    table (256 per channel) so correcting a frame is a single lookup.
+    The limiter estimates the current a frame draws, max_ma_per_channel for
+    every channel at full value plus idle_ma per pixel, allowing for the
+    strips' brightness setting (applied later by rpi_ws281x), and scales
+    the whole frame down to fit power_limit_ma; 0 disables it. limited
+    counts the frames scaled down and current holds the estimate for the
+    last frame before limiting, in mA.
+
+    With dither the table holds 8.8 fixed point values and each pixel adds
+    a threshold that steps through all 256 values over 256 frames before
+    dropping the fraction, so dim levels that gamma rounds to the same
+    8-bit value average out to the right brightness over time. That only
+    looks smooth at high output rates, i.e. with interpolation on.
+
+    set_level() dims everything by rebuilding the table, e.g. for a
+    brightness knob; the strips' own brightness needs the library.
+    """
+
+    def __init__(self, gamma=2.2, white_balance=(1.0, 1.0, 1.0), power_limit_ma=0,
+                 max_ma_per_channel=20.0, idle_ma=1.0, brightness=255, dither=False):
+        self.gamma = gamma
+        self.white_balance = white_balance
+        self.dither = dither
+        self.set_level(1.0)
+        # Added to each pixel's r,g,b to index the channel's part of the table
+        self.offsets = np.array([0, 256, 512], dtype=np.uint16)
+        self.power_limit_ma = power_limit_ma
+        self.ma_per_step = max_ma_per_channel / 255.0 * brightness / 255.0
+        self.idle_ma = idle_ma
+        self.limited = 0
+        self.current = 0.0
+        self.index = None
+
+    def set_level(self, level):
+        """Scales every output value by level (0.0-1.0)."""
+        self.level = min(max(level, 0.0), 1.0)
+        x = np.arange(256) / 255.0
+        scale = 255.0 * 256 if self.dither else 255.0
+        lut = np.empty((3, 256), dtype=np.uint16 if self.dither else np.uint8)
+        for c in range(3):
+            lut[c] = np.round(np.clip(x ** self.gamma * self.white_balance[c], 0.0, 1.0) * self.level * scale)
+        self.lut = lut.ravel()
+
+    def apply(self, frame, out):
+        """Writes the corrected (num_pixels, 3) uint8 frame into out."""
+        if self.index is None or self.index.shape != frame.shape:
+            self.index = np.empty(frame.shape, dtype=np.uint16)
+            if self.dither:
+                self.value = np.empty(frame.shape, dtype=np.uint16)
+                self.threshold = np.random.default_rng(0).integers(0, 256, frame.shape, dtype=np.uint16)
+        np.add(frame, self.offsets, out=self.index)
+        if self.dither:
+            np.take(self.lut, self.index, out=self.value)
+            # 159 is odd, so every pixel visits each threshold once per 256 frames
+            self.threshold += 159
+            self.threshold &= 0xFF
+            self.value += self.threshold
+            np.right_shift(self.value, 8, out=out, casting='unsafe')
+        else:
+            np.take(self.lut, self.index, out=out)
+        if not self.power_limit_ma:
+            return
+        idle = self.idle_ma * len(frame)
+        self.current = idle + int(out.sum(dtype=np.uint64)) * self.ma_per_step
+        if self.current > self.power_limit_ma:
+            scale = max(self.power_limit_ma - idle, 0.0) / (self.current - idle)
+            np.multiply(out, scale, out=out, casting='unsafe')
+            self.limited += 1
+
+
+class FrameDecoder:
+    """
+    Copies flat [r,g,b,r,g,b,...] frames straight into the strips' pixel
+    buffers. indices[i] holds, for every pixel of strip i, the global pixel
+    index it shows (see led_topology); without it global pixel i lands on
+    the first strip until it is full, then the next one, and so on. The
+    index arrays are built once, so decoding a frame is one gather per strip.
+    dirty[i] is set when strip i's pixels changed and stays set until the
+    strip has been shown. An optional ColorCorrection is applied to every
+    frame before it is copied out.
+    """
+
+    def __init__(self, buffers, indices=None, correction=None):
+        self.buffers = buffers
+        self.correction = correction
+        if indices is None:
+            indices = []
+            offset = 0
+            for buf in buffers:
+                indices.append(np.arange(offset, offset + len(buf)))
+                offset += len(buf)
+        self.indices = indices
+        # Plain slices for strips that show a contiguous run of pixels; a view is cheaper than a gather
+        self.sources = []
+        for index in indices:
+            if len(index) and np.array_equal(index, np.arange(index[0], index[0] + len(index))):
+                self.sources.append(slice(int(index[0]), int(index[0]) + len(index)))
+            else:
+                self.sources.append(index)
+        self.num_pixels = max((int(index.max()) + 1 for index in indices if len(index)), default=0)
+        # Last frame received, so pixels a short frame does not cover keep their colour
+        self.frame = np.zeros((self.num_pixels, 3), dtype=np.uint8)
+        # Corrected copy of frame; frame itself stays as sent so short frames are not corrected twice
+        self.corrected = self.frame if correction is None else np.zeros_like(self.frame)
+        # Start dirty so the first frame is always pushed to the strips
+        self.dirty = [True] * len(buffers)
+
+    def decode(self, data):
+        """Writes one frame into the buffers. Pixels beyond the frame keep their previous colour."""
+        num_pixels = min(memoryview(data).nbytes // 3, self.num_pixels)
+        self.frame[:num_pixels] = np.frombuffer(data, dtype=np.uint8, count=num_pixels * 3).reshape(num_pixels, 3)
+        if self.correction is not None:
+            self.correction.apply(self.frame, self.corrected)
+        for i, (source, buf) in enumerate(zip(self.sources, self.buffers)):
+            chunk = self.corrected[source]
+            # Reversed columns turn r,g,b into the B,G,R byte order of the native buffer
+            target = buf[:len(chunk), 2::-1]
+            if not self.dirty[i] and np.array_equal(target, chunk):
+                continue
+            target[:] = chunk
+            self.dirty[i] = True
+
+    def clear(self):
+        self.frame[:] = 0
+        self.corrected[:] = 0
+        for i, buf in enumerate(self.buffers):
+            buf[:] = 0
+            self.dirty[i] = True
+
+
+class StripOutput:
+    """
+    Ties the strips to a FrameDecoder over their native buffers, mapped by
+    indices as in FrameDecoder. show() only
+    pushes strips whose pixels changed since they were last shown, so a
+    repeated frame (e.g. the black frames between metronome ticks) costs no
+    wire time at all. shown/skipped count show() calls made and avoided per
+    strip, skipped_frames the frames where no strip needed showing, and
+    show_times holds a histogram of show() durations per strip.
+    """
+
+    def __init__(self, strips, indices=None, correction=None):
+        self.strips = strips
+        self.decoder = FrameDecoder([strip_buffer(strip) for strip in strips], indices, correction)
+        self.shown = [0] * len(strips)
+        self.skipped = [0] * len(strips)
+        self.skipped_frames = 0
+        self.show_times = [Histogram() for _ in strips]
+
+    def write(self, data):
+        self.decoder.decode(data)
+
+    def show(self):
+        dirty = self.decoder.dirty
+        if not any(dirty):
+            self.skipped_frames += 1
+        # Show strips sequentially; the library is not thread-safe
+        for i, strip in enumerate(self.strips):
+            if dirty[i]:
+                start = time.perf_counter()
+                strip.show()
+                self.show_times[i].record(time.perf_counter() - start)
+                dirty[i] = False
+                self.shown[i] += 1
+            else:
+                self.skipped[i] += 1
+
+    def clear(self):
+        self.decoder.clear()
+        self.show()
+
+
+def wire_time(strip):
+    """Seconds it takes to clock one frame out to the strip: 24 bits per pixel at 800kHz, plus the latch."""
+    return strip.numPixels() * 24 * 1.25e-6 + LED_RESET_TIME
+
+
+class PipelinedOutput(StripOutput):
+    """
+    Double-buffered StripOutput. write() decodes into back buffers on the
+    calling thread and show() only hands them over and returns; an output
+    thread, the only one that calls into rpi_ws281x (it is not
+    thread-safe), copies the strips that changed into their native buffers
+    and shows them. The next frame can therefore be received and decoded
+    while the current one is being clocked out.
+
+    show() in rpi_ws281x holds the GIL, including while it waits for the
+    strip's previous transfer to finish, so the output thread sleeps until
+    each strip's last transfer is done before calling it. Transfers of
+    different strips only overlap if they use different DMA channels.
+    A frame replaced by a newer one before the output thread took it is
+    counted in superseded.
+    """
+
+    def __init__(self, strips, indices=None, correction=None):
+        super().__init__(strips, indices)
+        self.native = self.decoder.buffers
+        self.back = [np.zeros_like(buf) for buf in self.native]
+        self.decoder = FrameDecoder(self.back, self.decoder.indices, correction)
+        self.wire_times = [wire_time(strip) for strip in strips]
+        self.busy_until = [0.0] * len(strips)
+        self.superseded = 0
+        self.pending = False
+        self.showing = False
+        # Push every strip on the first frame, like FrameDecoder's initial dirty flags
+        self.force = True
+        self.cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def write(self, data):
+        with self.cond:
+            self.decoder.decode(data)
+
+    def show(self):
+        with self.cond:
+            if self.pending:
+                self.superseded += 1
+            self.pending = True
+            self.cond.notify_all()
+
+    def clear(self):
+        with self.cond:
+            self.decoder.clear()
+            self.force = True
+        self.show()
+        self.flush()
+
+    def flush(self):
+        """Blocks until the output thread has shown everything handed to it."""
+        with self.cond:
+            while self.pending or self.showing:
+                self.cond.wait()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                changed = []
+                for i, (native, back) in enumerate(zip(self.native, self.back)):
+                    if self.force or not np.array_equal(native, back):
+                        native[:] = back
+                        changed.append(i)
+                self.pending = False
+                self.force = False
+                self.showing = True
+
+            if not changed:
+                self.skipped_frames += 1
+            for i, strip in enumerate(self.strips):
+                if i not in changed:
+                    self.skipped[i] += 1
+                    continue
+                delay = self.busy_until[i] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                start = time.perf_counter()
+                try:
+                    strip.show()
+                except RuntimeError as e:
+                    print("Strip show error:", e)
+                end = time.perf_counter()
+                self.show_times[i].record(end - start)
+                self.busy_until[i] = end + self.wire_times[i]
+                self.shown[i] += 1
+
+            with self.cond:
+                self.showing = False
+                self.cond.notify_all()
+
+
+class FrameInterpolator:
+    """
+    Blends from the frame on display towards the next queued one, so
+    frames sent at 30 fps can be shown at a higher output rate. set()
+    takes the frame that reached its display time; blend() returns the
+    mix at time now between it and the next frame, due at next_time, as
+    a view valid until the next call. Only a steady stream is blended:
+    when the next frame is more than max_stretch times the interval
+    between the last two frames away (e.g. a metronome flash after a
+    pause) the current frame is held until it is due, so changes never
+    show before their time.
+    """
+
+    def __init__(self, max_pixels, max_stretch=2.0):
+        self.current = np.zeros(max_pixels * 3, dtype=np.uint8)
+        self.length = 0
+        self.time = 0.0
+        self.interval = None  # display time between the last two frames
+        self.max_stretch = max_stretch
+        self.mix = np.empty(max_pixels * 3, dtype=np.float32)
+        self.out = np.empty(max_pixels * 3, dtype=np.uint8)
+
+    def set(self, display_time, pixels):
+        self.interval = display_time - self.time if self.length else None
+        self.length = min(memoryview(pixels).nbytes, len(self.current))
+        self.current[:self.length] = np.frombuffer(pixels, dtype=np.uint8, count=self.length)
+        self.time = display_time
+
+    def blend(self, now, next_time, next_pixels):
+        span = next_time - self.time
+        if span > 0 and (self.interval is None or span > self.max_stretch * self.interval):
+            return memoryview(self.current)[:self.length]
+        n = min(self.length, len(next_pixels))
+        alpha = min(max((now - self.time) / span, 0.0), 1.0) if span > 0 else 1.0
+        current = self.current[:n]
+        mix = self.mix[:n]
+        np.subtract(np.frombuffer(next_pixels, dtype=np.uint8, count=n), current, out=mix, dtype=np.float32)
+        mix *= alpha
+        mix += current
+        mix += 0.5
+        self.out[:n] = mix
+        return memoryview(self.out)[:n]
+
+
+class Compositor:
+    """
+    Keeps the latest frame of every source and draws them as layers, lowest
+    source first, each with its blend mode and opacity (see
+    led_protocol.BLEND_MODES; "replace" below full opacity mixes like
+    "alpha"). Layers under the topmost opaque "replace" layer are skipped.
+    A layer not updated for timeouts[source] seconds (timeout if the
+    source is not listed, None for never) is dropped by expire().
+    Every layer is a FrameInterpolator, so compose() can blend a layer
+    towards its next queued frame.
+    """
+
+    def __init__(self, max_pixels, timeout=2.0, timeouts=None):
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        self.max_pixels = max_pixels
+        self.layers = {}  # source -> FrameInterpolator
+        self.modes = {}   # source -> (blend, opacity, time.time() of the last update)
+        self.acc = np.zeros(max_pixels * 3, dtype=np.int32)
+        self.tmp = np.empty(max_pixels * 3, dtype=np.int32)
+        self.out = np.empty(max_pixels * 3, dtype=np.uint8)
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.layers)
+
+    def set(self, source, display_time, pixels, blend="replace", opacity=255):
+        layer = self.layers.get(source)
+        if layer is None:
+            layer = self.layers[source] = FrameInterpolator(self.max_pixels)
+        layer.set(display_time, pixels)
+        self.modes[source] = (blend, opacity, time.time())
+
+    def remove(self, source):
+        self.layers.pop(source, None)
+        self.modes.pop(source, None)
+
+    def _expiry(self, source):
+        timeout = self.timeouts.get(source, self.timeout)
+        return None if timeout is None else self.modes[source][2] + timeout
+
+    def next_expiry(self):
+        """time.time() the next layer times out at, or None."""
+        times = [t for t in map(self._expiry, self.layers) if t is not None]
+        return min(times, default=None)
+
+    def expire(self, now):
+        """Drops layers that timed out; returns True if any did."""
+        stale = [source for source in self.layers if (self._expiry(source) or now + 1) <= now]
+        for source in stale:
+            self.remove(source)
+        self.expired += len(stale)
+        return bool(stale)
+
+    def _pixels(self, source, now, upcoming):
+        layer = self.layers[source]
+        if source in upcoming:
+            return layer.blend(now, *upcoming[source])
+        return memoryview(layer.current)[:layer.length]
+
+    def compose(self, now, upcoming=None):
+        """
+        Returns the composited frame as a flat r,g,b view, valid until the
+        next call. upcoming maps a source to (display_time, pixels) of its
+        next queued frame, for layers that should be interpolated.
+        """
+        upcoming = upcoming or {}
+        order = sorted(self.layers)
+        bottom = 0
+        for i, source in enumerate(order):
+            blend, opacity, _ = self.modes[source]
+            if blend == "replace" and opacity == 255:
+                bottom = i
+        order = order[bottom:]
+        if not order:
+            return memoryview(self.out)[:0]
+        blend, opacity, _ = self.modes[order[0]]
+        if len(order) == 1 and blend == "replace" and opacity == 255:
+            # A single opaque layer is the frame itself
+            return self._pixels(order[0], now, upcoming)
+
+        length = max(self.layers[source].length for source in order)
+        self.acc[:length] = 0
+        for source in order:
+            blend, opacity, _ = self.modes[source]
+            pixels = np.frombuffer(self._pixels(source, now, upcoming), dtype=np.uint8)
+            n = len(pixels)
+            acc = self.acc[:n]
+            tmp = self.tmp[:n]
+            if blend == "replace" and opacity == 255:
+                acc[:] = pixels
+            elif blend in ("replace", "alpha"):
+                np.subtract(pixels, acc, out=tmp)
+                tmp *= opacity
+                tmp //= 255
+                acc += tmp
+            else:
+                tmp[:] = pixels
+                if opacity != 255:
+                    tmp *= opacity
+                    tmp //= 255
+                if blend == "add":
+                    acc += tmp
+                    np.minimum(acc, 255, out=acc)
+                else:
+                    np.maximum(acc, tmp, out=acc)
+        self.out[:length] = self.acc[:length]
+        return memoryview(self.out)[:length]
+
+
+class FrameRing:
+    """
+    Fixed-size queue of frames waiting for their display time, kept in
+    display time order so a frame shown on arrival never waits behind
+    another source's frames scheduled further ahead. Every slot is
+    allocated up front and frames are copied in, so receiving never
+    allocates; ordering moves slots, not pixels. When the ring is full the
+    frame due first is dropped and counted in overflows. Each frame can
+    carry a tag, e.g. the layer it belongs to.
+    """
+
+    def __init__(self, num_slots, max_pixels):
+        self.slots = [bytearray(max_pixels * 3) for _ in range(num_slots)]
+        self.lengths = [0] * num_slots
+        self.times = [0.0] * num_slots
+        self.tags = [None] * num_slots
+        self.head = 0   # index of the oldest frame
+        self.count = 0
+        self.overflows = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, display_time, pixels, tag=None):
+        """Copies a frame into the ring. Pixels beyond max_pixels are ignored."""
+        if self.count == len(self.slots):
+            self.head = (self.head + 1) % len(self.slots)
+            self.count -= 1
+            self.overflows += 1
+        index = (self.head + self.count) % len(self.slots)
+        slot = self.slots[index]
+        length = min(len(pixels), len(slot))
+        slot[:length] = pixels[:length]
+        self.lengths[index] = length
+        self.times[index] = display_time
+        self.tags[index] = tag
+        self.count += 1
+        # Move it ahead of frames due later; frames usually arrive in order, so this rarely runs
+        n = len(self.slots)
+        for i in range(self.count - 1, 0, -1):
+            a, b = (self.head + i - 1) % n, (self.head + i) % n
+            if self.times[a] <= self.times[b]:
+                break
+            for items in (self.slots, self.lengths, self.times, self.tags):
+                items[a], items[b] = items[b], items[a]
+
+    def display_time(self, i=0):
+        """Display time of the i-th oldest frame."""
+        return self.times[(self.head + i) % len(self.slots)]
+
+    def tag(self, i=0):
+        """Tag of the i-th oldest frame."""
+        return self.tags[(self.head + i) % len(self.slots)]
+
+    def peek(self, i=0):
+        """Returns a view of the i-th oldest frame's pixels without removing it."""
+        index = (self.head + i) % len(self.slots)
+        return memoryview(self.slots[index])[:self.lengths[index]]
+
+    def pop(self):
+        """Removes the oldest frame and returns a view of its pixels, valid until the slot is reused."""
+        index = self.head
+        self.head = (self.head + 1) % len(self.slots)
+        self.count -= 1
+        return memoryview(self.slots[index])[:self.lengths[index]]
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Bucket upper bounds for timings: 10us to ~1.3s, each sqrt(2) wider than the last
+TIME_BOUNDS = [10e-6 * 2 ** (k / 2) for k in range(35)]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram; record() is a bisect and two additions so it can
+    stay on in the frame path. Percentiles are the upper bound of the bucket
+    they fall in.
+    """
+
+    def __init__(self, bounds=TIME_BOUNDS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+        target = p / 100 * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            if seen >= target:
+                return bound
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Counters, histograms and gauges (callables read when a snapshot is
+    taken) for the receiver. Names are free-form; snapshot() returns them
+    all as a JSON-friendly dict.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def histogram(self, name, bounds=TIME_BOUNDS):
+        """Returns the named histogram, creating it on first use."""
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram(bounds)
+        return hist
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def snapshot(self):
+        return {
+            "uptime": time.time() - self.started,
+            "counters": dict(self.counters),
+            "gauges": {name: fn() for name, fn in list(self.gauges.items())},
+            "histograms": {name: hist.summary() for name, hist in list(self.histograms.items())},
+        }
+
+    def log_line(self):
+        """One-line summary for the console."""
+        snap = self.snapshot()
+        parts = [f"{name}={value}" for name, value in sorted(snap["counters"].items())]
+        parts += [f"{name}={value}" for name, value in sorted(snap["gauges"].items())]
+        for name, hist in sorted(snap["histograms"].items()):
+            if name.endswith("_time"):
+                parts.append(f"{name}=p50 {hist['p50'] * 1000:.2f}ms/p99 {hist['p99'] * 1000:.2f}ms")
+            else:
+                parts.append(f"{name}=p50 {hist['p50']:g}/max {hist['max']:g}")
+        return "Stats: " + " ".join(parts)
+
+
+class IntervalStats:
+    """
+    Turns cumulative counters and histograms into values for the interval
+    since the previous call with the same name.
+    """
+
+    def __init__(self):
+        self.last = {}
+
+    def delta(self, name, value):
+        change = value - self.last.get(name, 0)
+        self.last[name] = value
+        return change
+
+    def mean(self, name, hist):
+        """Mean of the values recorded in hist since the last call, 0.0 if there were none."""
+        count = self.delta(name + ".count", hist.count)
+        total = self.delta(name + ".total", hist.total)
+        return total / count if count else 0.0
+
+
+def serve_stats(metrics, host, port):
+    """Serves metrics.snapshot() as JSON over HTTP from a background thread, e.g. curl http://ledpi.local:5006/"""
+
+    class StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(metrics.snapshot(), indent=2).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # keep the console for the periodic stats line
+
+    server = HTTPServer((host, port), StatsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,627 @@
+import json
+import random
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from collections import deque, namedtuple
+
+# =============================
+# WIRE FORMAT
+# =============================
+# Every datagram starts with this header, followed by the fragment payload:
+#
+#   magic     2s  b"LT"
+#   version   B   PROTOCOL_VERSION
+#   flags     B   FLAG_* bits describing how the payload is encoded
+#   seq       I   frame sequence number, from a random start, wraps at 2**32
+#   timestamp d   sender time.time() when the frame was encoded, or with
+#                 FLAG_SCHEDULED the time.time() on the Pi to display it at
+#   total     H   number of pixels in the whole frame
+#   offset    H   global index of the first pixel in this fragment
+#   index     B   fragment number within the frame
+#   count     B   number of fragments in the frame
+#   source    B   layer the frame belongs to; higher layers are drawn on top
+#   blend     B   index into BLEND_MODES, how the layer is drawn over those below
+#   opacity   B   layer opacity, 255 = opaque
+#
+# Without FLAG_RLE the payload is the r,g,b bytes of PIXELS_PER_FRAGMENT (or
+# fewer, for the last fragment) consecutive pixels. With FLAG_RLE it is a list
+# of runs, each a uint16 length followed by either one pixel repeated length
+# times, or (when the RUN_LITERAL bit is set) length raw pixels.
+# With FLAG_DELTA the decoded pixels are XORed onto frame seq - 1.
+# Sequence numbers, deltas and staleness are tracked per source.
+#
+# Clock sync datagrams share the port and look like:
+#
+#   magic     2s  b"LC"
+#   version   B   PROTOCOL_VERSION
+#   kind      B   SYNC_PING or SYNC_PONG
+#   id        I   ping number, echoed in the pong
+#   t1        d   sender time.time() when the ping was sent
+#   t2        d   Pi time.time() when the ping arrived (pong only)
+#   t3        d   Pi time.time() when the pong was sent (pong only)
+#
+# Effect control datagrams make the Pi render an effect itself (see
+# led_effects.py) instead of showing streamed frames:
+#
+#   magic     2s  b"LE"
+#   version   B   PROTOCOL_VERSION
+#   body          UTF-8 JSON object {"effect": name, "params": {...}};
+#                 the effect "off" stops local rendering
+#
+# Every FEEDBACK_INTERVAL the Pi reports back to each address that sent it
+# frames recently, so senders can match their frame rate to it:
+#
+#   magic        2s  b"LF"
+#   version      B   PROTOCOL_VERSION
+#   (padding)    x
+#   output_fps   f   frames the Pi put out per second
+#   received_fps f   frames per second that arrived complete
+#   dropped      I   frames of the receiving sender's sources lost in the
+#                    interval: incomplete, stale, or overwritten before
+#                    they could be shown
+#   show_time    f   mean seconds the slowest strip needs per frame
+#   frame_time   f   mean seconds to build and decode a frame
+#   capacity_fps f   estimated highest rate the Pi can sustain, 0 if unknown
+MAGIC = b"LT"
+PROTOCOL_VERSION = 2
+HEADER = struct.Struct("!2sBBIdHHBBBBB")
+RUN = struct.Struct("!H")
+
+FLAG_RLE = 0x01
+FLAG_DELTA = 0x02
+FLAG_SCHEDULED = 0x04
+
+SYNC_MAGIC = b"LC"
+SYNC = struct.Struct("!2sBBIddd")
+SYNC_PING = 0
+SYNC_PONG = 1
+
+EFFECT_MAGIC = b"LE"
+
+FEEDBACK_MAGIC = b"LF"
+FEEDBACK = struct.Struct("!2sBxffIfff")
+FEEDBACK_INTERVAL = 1.0
+
+RUN_LITERAL = 0x8000
+MAX_RUN = 0x7FFF
+# Repeats shorter than this are cheaper to send inside a literal run
+MIN_REPEAT = 3
+
+# Keep each datagram under a typical 1500 byte MTU so Wi-Fi never has to
+# IP-fragment it; losing one fragment then only loses that frame.
+MAX_DATAGRAM = 1400
+MAX_PAYLOAD = MAX_DATAGRAM - HEADER.size
+PIXELS_PER_FRAGMENT = MAX_PAYLOAD // 3
+
+SEQ_MASK = 0xFFFFFFFF
+# A frame up to this many sequence numbers behind the last shown one is stale;
+# anything further back means the sender restarted its count. Senders start
+# counting at a random number, so a restarted sender almost never lands
+# inside the window behind its previous run and is not mistaken for stale.
+STALE_WINDOW = 256
+
+# Encoding modes for FrameEncoder / FrameSender
+ENCODINGS = ("raw", "rle", "delta")
+# In "delta" mode a whole frame is sent at least this often, so a receiver
+# that lost a frame recovers within this many frames
+KEYFRAME_INTERVAL = 30
+
+# Layer blend modes (see led_frames.Compositor), in wire order: "replace"
+# hides everything below, "alpha" mixes by opacity, "add" adds and "max"
+# keeps the brighter of each channel, both scaled by opacity
+BLEND_MODES = ("replace", "alpha", "add", "max")
+
+Feedback = namedtuple("Feedback", ["output_fps", "received_fps", "dropped", "show_time", "frame_time", "capacity_fps"])
+
+# scheduled is True when timestamp is the display time in the Pi's clock;
+# blend is a BLEND_MODES name and opacity 0..255
+Frame = namedtuple("Frame", ["seq", "timestamp", "pixels", "scheduled", "source", "blend", "opacity"])
+
+
+def seq_newer(a, b):
+    """True if sequence number a comes after b, allowing for wraparound."""
+    return a != b and ((a - b) & SEQ_MASK) < 0x80000000
+
+
+def rle_runs(pixels):
+    """
+    Splits an (n, 3) uint8 frame into runs, returned as (start, length, literal)
+    arrays. Repeats of at least MIN_REPEAT identical pixels become repeat runs;
+    everything in between is merged into literal runs.
+    """
+    n = len(pixels)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty.astype(bool)
+    change = np.any(pixels[1:] != pixels[:-1], axis=1)
+    starts = np.concatenate(([0], np.flatnonzero(change) + 1))
+    lengths = np.diff(np.append(starts, n))
+    repeat = lengths >= MIN_REPEAT
+    # A run starts a new token if it is a repeat or follows one
+    new_token = repeat.copy()
+    new_token[1:] |= repeat[:-1]
+    new_token[0] = True
+    first = np.flatnonzero(new_token)
+    return starts[first], np.add.reduceat(lengths, first), ~repeat[first]
+
+
+def rle_fragments(pixels):
+    """Packs an (n, 3) uint8 frame into RLE payloads of at most MAX_PAYLOAD bytes, as (offset, payload) pairs."""
+    fragments = []
+    payload = bytearray()
+    offset = 0
+    for start, length, literal in zip(*rle_runs(pixels)):
+        start = int(start)
+        length = int(length)
+        while length > 0:
+            room = MAX_PAYLOAD - len(payload) - RUN.size
+            if room < 3:
+                fragments.append((offset, bytes(payload)))
+                payload = bytearray()
+                continue
+            num = min(length, MAX_RUN, room // 3) if literal else min(length, MAX_RUN)
+            if not payload:
+                offset = start
+            if literal:
+                payload += RUN.pack(RUN_LITERAL | num)
+                payload += pixels[start:start + num].tobytes()
+            else:
+                payload += RUN.pack(num)
+                payload += pixels[start].tobytes()
+            start += num
+            length -= num
+    fragments.append((offset, bytes(payload)))
+    return fragments
+
+
+def rle_decode_into(payload, out, offset):
+    """
+    Expands an RLE payload into the bytearray out starting at pixel offset.
+    Returns False if it does not fit or is truncated; out may then have
+    been partly written.
+    """
+    pos = 0
+    end = len(payload)
+    start = offset * 3
+    while pos < end:
+        if pos + RUN.size > end:
+            return False
+        (word,) = RUN.unpack_from(payload, pos)
+        pos += RUN.size
+        num = (word & MAX_RUN) * 3
+        if start + num > len(out):
+            return False
+        if word & RUN_LITERAL:
+            if pos + num > end:
+                return False
+            out[start:start + num] = payload[pos:pos + num]
+            pos += num
+        else:
+            if pos + 3 > end:
+                return False
+            out[start:start + num] = bytes(payload[pos:pos + 3]) * (num // 3)
+            pos += 3
+        start += num
+    return True
+
+
+class FrameEncoder:
+    """
+    Splits flat [r,g,b,...] frames into sequenced, MTU-sized datagrams.
+    encoding is one of ENCODINGS: "raw" sends pixels as they are, "rle"
+    run-length encodes every frame and "delta" sends RLE-encoded XOR
+    differences against the previous frame, with an RLE keyframe at least
+    every keyframe_interval frames or whenever it is smaller. Frames are
+    tagged with the layer source, blend mode and opacity (0.0-1.0).
+    """
+
+    def __init__(self, encoding="raw", keyframe_interval=KEYFRAME_INTERVAL, source=0, blend="replace", opacity=1.0):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown frame encoding: {encoding}")
+        if blend not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode: {blend}")
+        if not 0 <= source <= 255:
+            raise ValueError(f"Source must be 0-255, not {source}")
+        self.layer = (source, BLEND_MODES.index(blend), round(min(max(opacity, 0.0), 1.0) * 255))
+        self.encoding = encoding
+        self.keyframe_interval = keyframe_interval
+        # A random start, so the receiver does not discard a restarted sender's frames as stale
+        self.seq = random.getrandbits(32)
+        self.previous = None
+        self.difference = None
+        self.since_keyframe = 0
+
+    def encode(self, pixels, timestamp=None, scheduled=False):
+        """
+        Returns the list of datagrams for one frame. With scheduled=True,
+        timestamp is the time on the Pi's clock to display the frame at.
+        """
+        return [header + payload for header, payload in self.encode_parts(pixels, timestamp, scheduled)]
+
+    def encode_parts(self, pixels, timestamp=None, scheduled=False):
+        """
+        Like encode(), but returns each datagram as a (header, payload) pair
+        for scatter-gather sends. With the raw encoding the payloads are
+        memoryview slices of pixels, so nothing is copied; they are only
+        valid until pixels is next written to.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        pixels = memoryview(pixels).cast("B")
+        total = len(pixels) // 3
+
+        if self.encoding == "raw":
+            flags = 0
+            fragments = [(offset, pixels[offset * 3:(offset + PIXELS_PER_FRAGMENT) * 3])
+                         for offset in range(0, max(total, 1), PIXELS_PER_FRAGMENT)]
+        else:
+            flags = FLAG_RLE
+            frame = np.frombuffer(pixels, dtype=np.uint8, count=total * 3).reshape(total, 3)
+            fragments = rle_fragments(frame)
+            if self.encoding == "delta":
+                if (self.previous is not None and len(self.previous) == total
+                        and self.since_keyframe < self.keyframe_interval - 1):
+                    # Whole-frame changes (e.g. a flash after a black frame) can
+                    # be cheaper as a keyframe, so send whichever is smaller
+                    np.bitwise_xor(frame, self.previous, out=self.difference)
+                    delta = rle_fragments(self.difference)
+                    if sum(len(p) for _, p in delta) < sum(len(p) for _, p in fragments):
+                        fragments = delta
+                        flags |= FLAG_DELTA
+                if flags & FLAG_DELTA:
+                    self.since_keyframe += 1
+                else:
+                    self.since_keyframe = 0
+                if self.previous is None or len(self.previous) != total:
+                    self.previous = np.empty_like(frame)
+                    self.difference = np.empty_like(frame)
+                np.copyto(self.previous, frame)
+
+        if scheduled:
+            flags |= FLAG_SCHEDULED
+        count = len(fragments)
+        parts = []
+        for index, (offset, payload) in enumerate(fragments):
+            header = HEADER.pack(MAGIC, PROTOCOL_VERSION, flags, self.seq, timestamp,
+                                 total, offset, index, count, *self.layer)
+            parts.append((header, payload))
+        self.seq = (self.seq + 1) & SEQ_MASK
+        return parts
+
+
+class FrameSender:
+    """
+    Encodes frames and sends every fragment to the Pi.
+    If latency is given, a ClockSync runs alongside and, once the clocks
+    are synchronised, every frame is stamped to be displayed latency
+    seconds after it was sent; the Pi holds it until then, which absorbs
+    network jitter. Otherwise the Pi shows frames as they arrive.
+    source, blend and opacity place the frames on a layer, see FrameEncoder.
+    With max_fps, a RateFeedback listens for the Pi's reports on sock and
+    frame_interval is how long to wait between frames to stay just under
+    what the Pi keeps up with; without it frame_interval is None.
+    """
+
+    def __init__(self, sock, addr, encoding="raw", latency=None, source=0, blend="replace", opacity=1.0,
+                 max_fps=None):
+        self.sock = sock
+        self.addr = addr
+        self.encoder = FrameEncoder(encoding, source=source, blend=blend, opacity=opacity)
+        self.latency = latency
+        self.clock = ClockSync(addr) if latency is not None else None
+        self.feedback = RateFeedback(sock, max_fps) if max_fps else None
+        # socket.sendmsg() is not available on Windows
+        self.scatter_gather = hasattr(sock, "sendmsg")
+
+    @property
+    def frame_interval(self):
+        return 1.0 / self.feedback.fps if self.feedback is not None else None
+
+    def send(self, pixels, timestamp=None):
+        scheduled = False
+        if self.clock is not None and self.clock.offset is not None:
+            if timestamp is None:
+                timestamp = time.time()
+            timestamp = timestamp + self.clock.offset + self.latency
+            scheduled = True
+        parts = self.encoder.encode_parts(pixels, timestamp, scheduled)
+        if self.scatter_gather:
+            # Header and payload go out in one datagram without being joined,
+            # so raw frames are sent straight from the caller's buffer
+            for part in parts:
+                self.sock.sendmsg(part, (), 0, self.addr)
+        else:
+            for header, payload in parts:
+                self.sock.sendto(header + payload, self.addr)
+        if self.feedback is not None and not self.feedback.started:
+            # The socket only has a port to receive reports on once it has sent
+            self.feedback.start()
+
+
+class RateFeedback:
+    """
+    Reads the Pi's feedback reports from the sender's socket on a
+    background thread and adapts fps between min_fps and max_fps: it backs
+    off to 80% (and below headroom * the Pi's capacity) whenever the Pi
+    dropped frames, and otherwise creeps back up by 5% of max_fps per
+    report. quality (fps / max_fps) can be used to simplify effects when
+    the rate had to come down. report is the latest Feedback, or None.
+    """
+
+    def __init__(self, sock, max_fps, min_fps=5.0, headroom=0.9, log_interval=10.0):
+        self.sock = sock
+        self.max_fps = max_fps
+        self.min_fps = min(min_fps, max_fps)
+        self.headroom = headroom
+        self.log_interval = log_interval
+        self.fps = max_fps
+        self.report = None
+        self.started = False
+
+    @property
+    def quality(self):
+        return self.fps / self.max_fps
+
+    def start(self):
+        self.started = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        last_log = time.time()
+        while True:
+            try:
+                data = self.sock.recv(FEEDBACK.size)
+            except OSError:
+                # e.g. Windows reporting an ICMP port unreachable
+                time.sleep(0.1)
+                continue
+            report = parse_feedback(data)
+            if report is None:
+                continue
+            self.update(report)
+            if time.time() - last_log > self.log_interval:
+                last_log = time.time()
+                print(f"Pi feedback: {report.output_fps:.0f} fps out, {report.dropped} dropped, "
+                      f"capacity {report.capacity_fps:.0f} fps; sending at {self.fps:.0f} fps")
+
+    def update(self, report):
+        self.report = report
+        fps = self.fps
+        if report.dropped:
+            fps *= 0.8
+        else:
+            fps += 0.05 * self.max_fps
+        if report.capacity_fps > 0:
+            fps = min(fps, report.capacity_fps * self.headroom)
+        self.fps = min(max(fps, self.min_fps), self.max_fps)
+
+
+def feedback_message(report):
+    """Packs a Feedback report into a datagram."""
+    return FEEDBACK.pack(FEEDBACK_MAGIC, PROTOCOL_VERSION, *report)
+
+
+def parse_feedback(datagram):
+    """Returns the Feedback in a report datagram, or None if it is something else."""
+    if len(datagram) != FEEDBACK.size or datagram[:2] != FEEDBACK_MAGIC:
+        return None
+    return Feedback(*FEEDBACK.unpack(datagram)[2:])
+
+
+class ClockSync:
+    """
+    Estimates how far the Pi's clock is ahead of this one with NTP-style
+    ping/pongs on the LED port, from a background thread.
+    offset is taken from the lowest-RTT sample of the last window pings,
+    since that one was least delayed by queueing. rtt is the latest round
+    trip and jitter the smoothed RTT variation (as in RFC 3550), all in
+    seconds; the presentation latency should comfortably exceed rtt / 2
+    plus a few times jitter. offset is None until the first pong arrives.
+    """
+
+    def __init__(self, addr, interval=1.0, window=8, log_interval=10.0):
+        self.addr = addr
+        self.interval = interval
+        self.log_interval = log_interval
+        self.samples = deque(maxlen=window)  # (rtt, offset)
+        self.offset = None
+        self.rtt = None
+        self.jitter = 0.0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def now(self):
+        """Current time on the Pi's clock (local time until synchronised)."""
+        return time.time() + (self.offset or 0.0)
+
+    def _run(self):
+        ping_id = 0
+        last_log = time.time()
+        while True:
+            ping_id = (ping_id + 1) & SEQ_MASK
+            deadline = time.time() + self.interval
+            try:
+                self.sock.sendto(SYNC.pack(SYNC_MAGIC, PROTOCOL_VERSION, SYNC_PING, ping_id,
+                                           time.time(), 0.0, 0.0), self.addr)
+            except OSError as e:
+                print("Clock sync send error:", e)
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.sock.settimeout(remaining)
+                try:
+                    data = self.sock.recv(SYNC.size)
+                except socket.timeout:
+                    break
+                except OSError:
+                    # e.g. Windows reporting an ICMP port unreachable
+                    continue
+                t4 = time.time()
+                if len(data) != SYNC.size:
+                    continue
+                magic, _, kind, pong_id, t1, t2, t3 = SYNC.unpack(data)
+                if magic == SYNC_MAGIC and kind == SYNC_PONG and pong_id == ping_id:
+                    self._add_sample(t1, t2, t3, t4)
+
+            if self.offset is not None and time.time() - last_log > self.log_interval:
+                last_log = time.time()
+                print(f"Clock sync: offset={self.offset * 1000:.1f}ms "
+                      f"rtt={self.rtt * 1000:.1f}ms jitter={self.jitter * 1000:.1f}ms")
+
+    def _add_sample(self, t1, t2, t3, t4):
+        rtt = (t4 - t1) - (t3 - t2)
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        if self.rtt is not None:
+            self.jitter += (abs(rtt - self.rtt) - self.jitter) / 16
+        self.rtt = rtt
+        self.samples.append((rtt, offset))
+        self.offset = min(self.samples)[1]
+
+
+def sync_reply(datagram, received_at):
+    """
+    Returns the pong for a clock sync ping, or None if datagram is not a
+    ping. received_at is the local time.time() the ping arrived at.
+    """
+    if len(datagram) != SYNC.size or datagram[:2] != SYNC_MAGIC:
+        return None
+    _, _, kind, ping_id, t1, _, _ = SYNC.unpack(datagram)
+    if kind != SYNC_PING:
+        return None
+    return SYNC.pack(SYNC_MAGIC, PROTOCOL_VERSION, SYNC_PONG, ping_id, t1, received_at, time.time())
+
+
+def effect_message(name, params=None):
+    """Builds an effect control datagram selecting effect name with the given parameters."""
+    body = json.dumps({"effect": name, "params": params or {}}, separators=(",", ":"))
+    message = EFFECT_MAGIC + bytes([PROTOCOL_VERSION]) + body.encode('utf-8')
+    if len(message) > MAX_DATAGRAM:
+        raise ValueError(f"Effect parameters too large ({len(message)} bytes)")
+    return message
+
+
+def parse_effect(datagram):
+    """
+    Returns (name, params) for an effect control datagram, or None if
+    datagram is something else. Raises ValueError if it is malformed.
+    """
+    if len(datagram) < 3 or datagram[:2] != EFFECT_MAGIC:
+        return None
+    message = json.loads(bytes(datagram[3:]).decode('utf-8'))
+    if not isinstance(message, dict) or not isinstance(message.get("effect"), str):
+        raise ValueError("Effect message needs an effect name")
+    params = message.get("params") or {}
+    if not isinstance(params, dict):
+        raise ValueError("Effect params must be an object")
+    return message["effect"], params
+
+
+def frame_source(datagram):
+    """Layer source of a frame datagram; legacy datagrams without the header belong to source 0."""
+    if len(datagram) < HEADER.size or datagram[:2] != MAGIC or datagram[2] != PROTOCOL_VERSION:
+        return 0
+    return datagram[HEADER.size - 3]
+
+
+class FrameAssembler:
+    """
+    Rebuilds frames from fragments on the receiving side.
+    add() returns a Frame once every fragment of a frame has arrived.
+    Frames older than the last completed one are discarded, as are partial
+    frames once a newer frame completes. Delta frames are applied to the
+    previous frame; after a sequence gap they are dropped until the next
+    keyframe. Fragments with an impossible index or count, or that disagree
+    with earlier fragments of their frame on its size or fragment count,
+    are dropped. Datagrams without the header are treated as legacy
+    single-packet raw frames. One assembler handles one source (see
+    frame_source()), since each source numbers its frames separately.
+    Frame buffers are recycled, so copy a returned frame's pixels before
+    calling add() again.
+    """
+
+    def __init__(self, max_pending=4):
+        self.max_pending = max_pending
+        self.pending = {}  # seq -> [timestamp, flags, pixels, fragments still missing, fragment count]
+        self.last_seq = None
+        self.reference = None      # last completed frame, the base for deltas
+        self.reference_seq = None
+        self.dropped = 0   # frames discarded as stale, incomplete or undecodable
+        self.spare = []    # finished frame buffers, reused for new frames
+
+    def _buffer(self, size):
+        for i, buf in enumerate(self.spare):
+            if len(buf) == size:
+                return self.spare.pop(i)
+        return bytearray(size)
+
+    def _recycle(self, buf):
+        if isinstance(buf, bytearray) and len(self.spare) <= self.max_pending:
+            self.spare.append(buf)
+
+    def add(self, datagram):
+        if len(datagram) < HEADER.size or datagram[:2] != MAGIC or datagram[2] != PROTOCOL_VERSION:
+            self._recycle(self.reference)
+            self.reference = None
+            self.reference_seq = None
+            return Frame(None, time.time(), datagram, False, 0, "replace", 255)
+
+        _, _, flags, seq, timestamp, total, offset, index, count, source, blend, opacity = HEADER.unpack_from(datagram)
+        if blend >= len(BLEND_MODES) or index >= count:
+            # Also catches count == 0, which would complete an empty frame at once
+            self.dropped += 1
+            return None
+        if self.last_seq is not None and ((self.last_seq - seq) & SEQ_MASK) < STALE_WINDOW:
+            return None
+
+        entry = self.pending.get(seq)
+        if entry is not None and (len(entry[2]) != total * 3 or entry[4] != count):
+            # Fragments of one frame that disagree on its size or fragment count
+            self.dropped += 1
+            return None
+        if entry is None:
+            if len(self.pending) >= self.max_pending:
+                oldest = max(self.pending, key=lambda s: (seq - s) & SEQ_MASK)
+                self._recycle(self.pending.pop(oldest)[2])
+                self.dropped += 1
+            entry = [timestamp, flags, self._buffer(total * 3), set(range(count)), count]
+            self.pending[seq] = entry
+
+        if index in entry[3]:
+            payload = memoryview(datagram)[HEADER.size:]
+            if flags & FLAG_RLE:
+                ok = rle_decode_into(payload, entry[2], offset)
+            else:
+                start = offset * 3
+                ok = start + len(payload) <= len(entry[2])
+                if ok:
+                    entry[2][start:start + len(payload)] = payload
+            if ok:
+                entry[3].discard(index)
+        if entry[3]:
+            return None
+
+        # Frame complete: anything older that is still pending can never be shown
+        del self.pending[seq]
+        for s in [s for s in self.pending if not seq_newer(s, seq)]:
+            self._recycle(self.pending.pop(s)[2])
+            self.dropped += 1
+        self.last_seq = seq
+
+        pixels = entry[2]
+        if flags & FLAG_DELTA:
+            if self.reference_seq != ((seq - 1) & SEQ_MASK) or len(self.reference) != len(pixels):
+                # Missed the frame this delta is based on; wait for a keyframe
+                self._recycle(pixels)
+                self.reference_seq = None
+                self.dropped += 1
+                return None
+            delta = np.frombuffer(pixels, dtype=np.uint8)
+            np.bitwise_xor(delta, np.frombuffer(self.reference, dtype=np.uint8), out=delta)
+        self._recycle(self.reference)
+        self.reference = pixels
+        self.reference_seq = seq
+        return Frame(seq, entry[0], pixels, bool(flags & FLAG_SCHEDULED), source, BLEND_MODES[blend], opacity)
@@ -0,0 +1,237 @@
+import math
+import time
+from collections import OrderedDict
+import numpy as np
+from led_metrics import Histogram, IntervalStats
+
+
+class FrameBuffer:
+    """
+    Preallocated frame for the senders. level is an (n, 3) float32 working
+    buffer on a 0-255 scale that effects draw, fade and accumulate into; it
+    may go out of range. commit() clips it into pixels, the (n, 3) uint8
+    frame that goes on the wire, and returns view, a flat memoryview of
+    pixels that FrameSender.send() takes without copying. Nothing is
+    allocated per frame.
+    """
+
+    def __init__(self, num_pixels):
+        self.num_pixels = num_pixels
+        self.level = np.zeros((num_pixels, 3), dtype=np.float32)
+        self.pixels = np.zeros((num_pixels, 3), dtype=np.uint8)
+        self.view = memoryview(self.pixels).cast("B")
+
+    def __len__(self):
+        return self.num_pixels
+
+    def clear(self):
+        self.level.fill(0.0)
+
+    def fill(self, color):
+        self.level[:] = color
+
+    def fade(self, factor):
+        self.level *= factor
+
+    def commit(self):
+        np.clip(self.level, 0.0, 255.0, out=self.pixels, casting='unsafe')
+        return self.view
+
+
+def hue_to_rgb(hue):
+    """Fully saturated colours for an array of hues (0.0-1.0), as an (n, 3) array of 0.0-1.0."""
+    sector = np.asarray(hue, dtype=np.float32)[:, None] * 6.0
+    rgb = np.abs(sector - np.array([3.0, 2.0, 4.0], dtype=np.float32))
+    rgb[:, 0] -= 1.0
+    rgb[:, 1:] = 2.0 - rgb[:, 1:]
+    return np.clip(rgb, 0.0, 1.0, out=rgb)
+
+
+class FlashKernels:
+    """
+    Adds gaussian flashes, colour * min(1, intensity * exp(-d^2 / (2 scale^2))),
+    to (n, 3) frames. Along the string d is the distance in LEDs: one kernel
+    per scale, cut off at reach * scale where it no longer lights anything,
+    is cached and shifted to each centre; the cache_size most recently used
+    scales are kept. With coords, (n, 3) LED positions, d is the 3D
+    distance to the centre LED instead, in units of the median spacing
+    between neighbouring LEDs so scale means about the same. Those kernels
+    cover every LED and depend on centre and scale, which change with
+    every flash, so they are not cached: the squared distances come from
+    one matrix-vector product (|a - b|^2 = |a|^2 + |b|^2 - 2 a.b) and the
+    kernel is computed in preallocated buffers.
+    """
+
+    def __init__(self, num_pixels, coords=None, cache_size=64, reach=4.0):
+        self.num_pixels = num_pixels
+        self.cache_size = cache_size
+        self.reach = reach
+        self.coords = None
+        if coords is not None:
+            coords = np.asarray(coords, dtype=np.float32)[:num_pixels]
+            steps = np.linalg.norm(np.diff(coords, axis=0), axis=1)
+            steps = steps[steps > 0]
+            self.coords = np.ascontiguousarray(coords / (float(np.median(steps)) if len(steps) else 1.0))
+            self.norms = np.einsum('ij,ij->i', self.coords, self.coords)
+            self.falloff = np.empty(num_pixels, dtype=np.float32)
+        self.kernels = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.work = np.empty((num_pixels, 3), dtype=np.float32)
+
+    def kernel(self, center, scale):
+        """The falloff around center; in 3D a buffer that the next call overwrites."""
+        if self.coords is not None:
+            d2 = self.falloff
+            np.dot(self.coords, self.coords[center] * np.float32(-2.0), out=d2)
+            d2 += self.norms
+            d2 += self.norms[center]
+            np.maximum(d2, 0.0, out=d2)  # rounding can take it just below 0
+            d2 *= np.float32(-0.5 / (scale * scale))
+            return np.exp(d2, out=d2)
+        kernel = self.kernels.get(scale)
+        if kernel is not None:
+            self.kernels.move_to_end(scale)
+            self.hits += 1
+            return kernel
+        self.misses += 1
+        radius = math.ceil(self.reach * scale)
+        distance = np.arange(-radius, radius + 1, dtype=np.float32)
+        kernel = np.exp(distance * distance * np.float32(-0.5 / (scale * scale)))
+        kernel.flags.writeable = False
+        self.kernels[scale] = kernel
+        if len(self.kernels) > self.cache_size:
+            self.kernels.popitem(last=False)
+        return kernel
+
+    def add(self, out, center, scale, color, intensity=1.0):
+        """
+        Adds a flash around LED center to out, saturating at 255. Levels are
+        truncated to whole steps like int() would, so stacked flashes add up
+        exactly as they did per LED.
+        """
+        kernel = self.kernel(center, scale)
+        if self.coords is None:
+            radius = len(kernel) // 2
+            lo, hi = max(0, center - radius), min(self.num_pixels, center + radius + 1)
+            kernel = kernel[lo - center + radius:hi - center + radius]
+        else:
+            lo, hi = 0, self.num_pixels
+        work = self.work[:hi - lo]
+        np.multiply(kernel[:, None], np.float32(intensity), out=work)
+        np.minimum(work, 1.0, out=work)
+        work *= np.asarray(color, dtype=np.float32)
+        np.floor(work, out=work)
+        region = out[lo:hi]
+        region += work
+        np.minimum(region, 255.0, out=region)
+
+
+class FrameEffect:
+    """
+    Interface for sender-side effects. render(t, frame) draws the frame for
+    t seconds after the start into frame, a FrameBuffer, normally by writing
+    frame.level in place, so effects can fade and add onto what is there.
+    Effects keep their own state between calls and precompute in __init__
+    whatever does not change from frame to frame. Effects that only draw
+    whole frames are best written as a led_effects.Effect, which the Pi
+    can render too, and run here through PiEffect.
+    """
+
+    def render(self, t, frame):
+        raise NotImplementedError
+
+
+class PiEffect(FrameEffect):
+    """
+    Runs an on-Pi effect (a led_effects.Effect, which renders into an
+    (n, 3) uint8 array) as a FrameEffect, so the same effect code can be
+    streamed from the PC or rendered on the Pi. render() draws it into a
+    preallocated scratch frame and copies that into frame.level.
+    """
+
+    def __init__(self, effect):
+        self.effect = effect
+        self.pixels = np.zeros((effect.num_pixels, 3), dtype=np.uint8)
+
+    def render(self, t, frame):
+        self.effect.render(t, self.pixels)
+        frame.level[:] = self.pixels
+
+
+class FrameClock:
+    """
+    Paces a render loop on absolute perf_counter() deadlines. tick() sleeps
+    until the next frame is due and returns its scheduled time in seconds
+    since the first tick. Frames are due every interval from the first one,
+    so render and send time comes out of the wait instead of adding to it
+    and errors never accumulate. A frame started more than an interval late
+    skips the frames it missed instead of rushing through them. tick() may
+    be given a new interval (e.g. sender.frame_interval as the Pi's feedback
+    moves it), which applies from the next frame. Every log_interval seconds
+    (None for never) it prints the achieved fps, late and skipped frames and
+    the jitter, how late it woke up after each deadline.
+    """
+
+    def __init__(self, fps, log_interval=10.0, name="Frame clock"):
+        self.interval = 1.0 / fps
+        self.log_interval = log_interval
+        self.name = name
+        self.start = None
+        self.due = 0.0  # seconds since start of the current frame
+        self.frames = 0
+        self.late = 0  # frames whose deadline had passed before tick() was called
+        self.skipped = 0
+        self.jitter = Histogram()
+        self.interval_stats = IntervalStats()
+        self.last_log = None
+
+    def tick(self, interval=None):
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = self.last_log = now
+            self.frames = 1
+            return 0.0
+        if interval is not None:
+            self.interval = interval
+        self.due += self.interval
+        behind = now - self.start - self.due
+        if behind > 0:
+            self.late += 1
+            if behind > self.interval:
+                missed = int(behind / self.interval)
+                self.skipped += missed
+                self.due += missed * self.interval
+        else:
+            time.sleep(-behind)
+        self.jitter.record(max(0.0, time.perf_counter() - self.start - self.due))
+        self.frames += 1
+        if self.log_interval is not None and now - self.last_log >= self.log_interval:
+            print(self.log_line(now - self.last_log))
+            self.last_log = now
+        return self.due
+
+    def log_line(self, elapsed):
+        frames = self.interval_stats.delta("frames", self.frames)
+        late = self.interval_stats.delta("late", self.late)
+        skipped = self.interval_stats.delta("skipped", self.skipped)
+        return (f"{self.name}: {frames / elapsed:.1f} fps (target {1.0 / self.interval:.0f}), "
+                f"{late} late, {skipped} skipped, jitter p50 {self.jitter.percentile(50) * 1000:.2f}ms "
+                f"p99 {self.jitter.percentile(99) * 1000:.2f}ms max {self.jitter.max * 1000:.2f}ms")
+
+
+class VirtualClock:
+    """
+    FrameClock for offline renders: tick() returns the time of the next
+    frame straight away, so frames are produced as fast as they can be
+    rendered while effects see the same timeline as they would live.
+    """
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps
+        self.frames = 0
+
+    def tick(self, interval=None):
+        t = self.frames * self.interval
+        self.frames += 1
+        return t
@@ -0,0 +1,110 @@
+import gzip
+import mmap
+import struct
+
+# =============================
+# SHOW FILE FORMAT
+# =============================
+# A pre-rendered show is a fixed header followed by frame_count frames of
+# num_pixels r,g,b bytes each, back to back, so frame n starts at
+# HEADER.size + n * num_pixels * 3:
+#
+#   magic       4s  b"LSHW"
+#   version     B   SHOW_VERSION
+#   (padding)   3x
+#   num_pixels  I   pixels per frame
+#   fps         d   frames per second
+#
+# The frame count follows from the file size, so a show can be appended to
+# while it is being written. A show may also be gzip compressed as a whole;
+# ShowFile then decompresses it into memory instead of mapping it.
+SHOW_MAGIC = b"LSHW"
+SHOW_VERSION = 1
+HEADER = struct.Struct("!4sB3xId")
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class ShowWriter:
+    """
+    Writes a show file frame by frame; use as a context manager or call
+    close(). With compress=True the file is gzip compressed.
+    """
+
+    def __init__(self, path, num_pixels, fps, compress=False):
+        self.num_pixels = num_pixels
+        self.frame_size = num_pixels * 3
+        self.frame_count = 0
+        self.file = gzip.open(path, 'wb') if compress else open(path, 'wb')
+        self.file.write(HEADER.pack(SHOW_MAGIC, SHOW_VERSION, num_pixels, fps))
+
+    def write(self, pixels):
+        """Appends one frame of r,g,b bytes; shorter frames are padded with black."""
+        data = bytes(pixels)[:self.frame_size]
+        self.file.write(data)
+        if len(data) < self.frame_size:
+            self.file.write(bytes(self.frame_size - len(data)))
+        self.frame_count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShowFile:
+    """
+    Read-only, memory-mapped show file. frame(n) returns a memoryview of
+    frame n straight out of the page cache, so opening is instant and
+    memory use does not grow with the length of the show. Compressed shows
+    are read into memory whole instead. Views returned by frame() must be
+    released (or dropped) before close().
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        if self.file.read(len(GZIP_MAGIC)) == GZIP_MAGIC:
+            self.file.seek(0)
+            with gzip.GzipFile(fileobj=self.file) as compressed:
+                self.map = compressed.read()
+        else:
+            try:
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self.file.close()
+                raise ValueError(f"{path} is empty, not a show file")
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path} is too short to be a show file")
+        magic, version, self.num_pixels, self.fps = HEADER.unpack_from(self.map)
+        if magic != SHOW_MAGIC or version != SHOW_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {SHOW_VERSION} show file")
+        if self.num_pixels == 0 or self.fps <= 0:
+            self.close()
+            raise ValueError(f"{path} has an invalid header ({self.num_pixels} pixels at {self.fps} fps)")
+        self.frame_size = self.num_pixels * 3
+        self.frame_count = (len(self.map) - HEADER.size) // self.frame_size
+        if isinstance(self.map, mmap.mmap) and hasattr(mmap, "MADV_SEQUENTIAL"):
+            # Frames are read in order; let the kernel read ahead and drop pages behind us
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        self.view = memoryview(self.map)
+
+    @property
+    def duration(self):
+        return self.frame_count / self.fps
+
+    def frame(self, n):
+        start = HEADER.size + n * self.frame_size
+        return self.view[start:start + self.frame_size]
+
+    def close(self):
+        if getattr(self, "view", None) is not None:
+            self.view.release()
+            self.view = None
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
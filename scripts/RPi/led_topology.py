@@ -0,0 +1,79 @@
+import json
+import os
+from collections import namedtuple
+import numpy as np
+
+try:
+    from rpi_ws281x import PixelStrip, ws
+except ImportError:
+    # set_led.py / clear.py drive the strips through neopixel instead
+    PixelStrip = None
+
+# =============================
+# TOPOLOGY FILE
+# =============================
+# topology.json lists the strips in output order. Each strip has:
+#
+#   id           name used in messages
+#   pin          GPIO the data line is on
+#   channel      PWM channel for PWM pins (0 for GPIO 12/18, 1 for 13/19), 0 otherwise
+#   dma          DMA channel for rpi_ws281x; give each strip its own so their
+#                transfers overlap, and only use channels the OS leaves free
+#                (never 5, see the rpi_ws281x README)
+#   color_order  byte order the LEDs expect, e.g. "GRB" or "RGB"
+#   segments     runs of global pixels laid along the strip from its first
+#                LED onwards: {"start": first global pixel, "length": n,
+#                "reversed": true if the run goes from start + n - 1 down to start}
+#
+# The strip length is the sum of its segment lengths.
+TOPOLOGY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "topology.json")
+
+COLOR_ORDERS = ("RGB", "RBG", "GRB", "GBR", "BRG", "BGR")
+
+# index[j] is the global pixel shown by LED j of the strip
+StripLayout = namedtuple("StripLayout", ["id", "pin", "channel", "dma", "color_order", "index"])
+
+
+def load_topology(path=TOPOLOGY_FILE):
+    """Reads the topology file and compiles each strip's segments into its index array."""
+    with open(path, 'r') as f:
+        config = json.load(f)
+
+    layouts = []
+    for strip in config["strips"]:
+        color_order = strip.get("color_order", "GRB").upper()
+        if color_order not in COLOR_ORDERS:
+            raise ValueError(f"Strip {strip['id']}: unknown color order {color_order}")
+        runs = []
+        for segment in strip["segments"]:
+            run = np.arange(segment["start"], segment["start"] + segment["length"])
+            runs.append(run[::-1] if segment.get("reversed", False) else run)
+        index = np.concatenate(runs) if runs else np.zeros(0, dtype=np.int64)
+        if len(index) and index.min() < 0:
+            raise ValueError(f"Strip {strip['id']}: negative pixel index")
+        layouts.append(StripLayout(strip["id"], strip["pin"], strip.get("channel", 0),
+                                   strip.get("dma", 10), color_order, index))
+    return layouts
+
+
+def num_pixels(layouts):
+    """Number of global pixels, i.e. the frame length the strips expect."""
+    return max((int(layout.index.max()) + 1 for layout in layouts if len(layout.index)), default=0)
+
+
+def pixel_slots(layouts, pixel):
+    """Returns (strip number, LED on that strip) for every LED showing global pixel."""
+    return [(s, int(led)) for s, layout in enumerate(layouts)
+            for led in np.flatnonzero(layout.index == pixel)]
+
+
+def pixel_strips(layouts, freq_hz, invert, brightness):
+    """Creates and begins an rpi_ws281x PixelStrip per layout."""
+    strips = []
+    for layout in layouts:
+        strip = PixelStrip(len(layout.index), layout.pin, freq_hz, layout.dma, invert, brightness,
+                           channel=layout.channel,
+                           strip_type=getattr(ws, f"WS2811_STRIP_{layout.color_order}"))
+        strip.begin()
+        strips.append(strip)
+    return strips
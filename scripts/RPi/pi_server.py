@@ -1,7 +1,14 @@
 import socket
+import selectors
 import time
-from rpi_ws281x import PixelStrip, Color
-from collections import deque
+from led_control import Controls, UartControl
+from led_effects import EffectEngine, load_coordinates
+from led_external import DdpReceiver, E131Receiver, join_e131_multicast
+from led_frames import ColorCorrection, Compositor, FrameRing, PipelinedOutput
+from led_metrics import IntervalStats, Metrics, serve_stats
+from led_protocol import (FEEDBACK_INTERVAL, Feedback, FrameAssembler, feedback_message, frame_source,
+                          parse_effect, sync_reply)
+from led_topology import load_topology, pixel_strips
 
 # =============================
 # CONFIGURATION
@@ -9,86 +16,383 @@ from collections import deque
 UDP_IP = "0.0.0.0"  # listen on all interfaces
 UDP_PORT = 5005
 DISPLAY_DELAY = 0.0  # Delay in seconds
+RING_SLOTS = 64      # frames that can wait for display; about 1s at 60 fps
+# Blend from each frame towards the next queued one and show the result at
+# OUTPUT_FPS, so 30 fps streams fade smoothly. Needs frames to be queued
+# ahead, i.e. senders with a PRESENTATION_LATENCY. Frames more than two
+# frame intervals apart are not blended, the current one is held instead.
+INTERPOLATE = False
+OUTPUT_FPS = 90
+TEMPORAL_DITHER = False  # with INTERPOLATE, dither dim colours over time instead of rounding them
+# Senders tag frames with a source; the latest frame of each is layered
+# (higher sources on top) and dropped after LAYER_TIMEOUT seconds without
+# a new one. LAYER_TIMEOUTS overrides that per source, None keeps the
+# last frame up until a new one comes (the old single-sender behaviour).
+LAYER_TIMEOUT = 2.0
+LAYER_TIMEOUTS = {0: None}
+EFFECT_SOURCE = -1  # on-Pi effects are drawn below every streamed source
+# DDP and E1.31 (sACN) input from lighting software, mapped onto the global
+# pixel index and drawn on layer EXTERNAL_SOURCE; None disables a port.
+# E1.31 universes from E131_START_UNIVERSE on carry 170 pixels each.
+DDP_PORT = 4048
+E131_PORT = 5568
+E131_START_UNIVERSE = 1
+EXTERNAL_SOURCE = 0
 
-# LED strip configuration
-LED_PIN_1 = 18        # PWM0
-LED_PIN_2 = 21        # PCM_DOUT
-LED_PIN_3 = 13        # SPI_MOSI
+# Pico on the UART (pico/micropico/main.py), None to run without one. Its
+# knob sets DISPLAY_DELAY (0-MAX_POT_DELAY s, for calibration with
+# 01_calibration/resolve_delay.py) or, with POT_TARGET = "brightness", dims
+# the tree; its button steps through BUTTON_EFFECTS
+SERIAL_PORT = "/dev/serial0"
+SERIAL_BAUDRATE = 9600
+POT_TARGET = "delay"
+MAX_POT_DELAY = 1.0
+BUTTON_EFFECTS = ["off", "fire", "rainbow", "sparkle"]
+STATS_PORT = 5006    # HTTP port serving runtime stats as JSON
+STATS_LOG_INTERVAL = 10.0  # seconds between stats lines on the console, 0 to disable
+
+# LED strip configuration; pins, DMA channels, lengths and pixel layout are in topology.json
 LED_FREQ_HZ = 800000
-LED_DMA = 10
 LED_BRIGHTNESS = 255
 LED_INVERT = False
 
-# Initialize with some default length; will adjust per frame
-NUM_LEDS_PER_STRIP = 200
+# Senders emit linear RGB; it is gamma corrected, white balanced and then
+# scaled down as a whole if it would draw more than the supply can give
+GAMMA = 2.2
+WHITE_BALANCE = (1.0, 1.0, 1.0)  # r, g, b multipliers, e.g. (1.0, 0.85, 0.7) to warm up white
+POWER_LIMIT_MA = 10000           # supply current budget in mA, 0 to disable
+
+layouts = load_topology()
+strips = pixel_strips(layouts, LED_FREQ_HZ, LED_INVERT, LED_BRIGHTNESS)
 
-# Use different channels for PWM-based strips if they share a PWM peripheral
-strip1 = PixelStrip(NUM_LEDS_PER_STRIP, LED_PIN_1, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, channel=0)
-strip2 = PixelStrip(NUM_LEDS_PER_STRIP, LED_PIN_2, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS)
-strip3 = PixelStrip(NUM_LEDS_PER_STRIP, LED_PIN_3, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, channel=1)
-strip1.begin()
-strip2.begin()
-strip3.begin()
+# Frames are decoded on this thread while an output thread shows the previous
+# one; only strips whose pixels changed are pushed
+correction = ColorCorrection(GAMMA, WHITE_BALANCE, POWER_LIMIT_MA, brightness=LED_BRIGHTNESS,
+                             dither=INTERPOLATE and TEMPORAL_DITHER)
+output = PipelinedOutput(strips, [layout.index for layout in layouts], correction)
 
 sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 sock.bind((UDP_IP, UDP_PORT))
 sock.setblocking(False)
 
+# Control inputs run on their own threads and publish parameter changes here
+controls = Controls()
+if SERIAL_PORT:
+    try:
+        UartControl(controls, SERIAL_PORT, SERIAL_BAUDRATE, POT_TARGET, MAX_POT_DELAY, BUTTON_EFFECTS)
+    except Exception as e:
+        print(f"Warning: Could not open serial port: {e}")
+
+# Sleep in select() until a packet or a control change arrives, or the next frame is due
+selector = selectors.DefaultSelector()
+selector.register(sock, selectors.EVENT_READ)
+selector.register(controls, selectors.EVENT_READ)
+
 print("Listening for LED frames on UDP port", UDP_PORT)
 
-frame_buffer = deque()
+# Sockets for the standard protocols, each with the receiver that turns its packets into frames
+external = []
+if DDP_PORT:
+    ddp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    ddp_sock.bind((UDP_IP, DDP_PORT))
+    external.append((ddp_sock, DdpReceiver(output.decoder.num_pixels, EXTERNAL_SOURCE)))
+    print("Listening for DDP on UDP port", DDP_PORT)
+if E131_PORT:
+    e131_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    e131_sock.bind((UDP_IP, E131_PORT))
+    e131 = E131Receiver(output.decoder.num_pixels, E131_START_UNIVERSE, source=EXTERNAL_SOURCE)
+    join_e131_multicast(e131_sock, e131.universes)
+    external.append((e131_sock, e131))
+    print(f"Listening for E1.31 universes {e131.universes.start}-{e131.universes.stop - 1} on UDP port", E131_PORT)
+for ext_sock, _ in external:
+    ext_sock.setblocking(False)
+    selector.register(ext_sock, selectors.EVENT_READ)
+
+recv_buffer = bytearray(65536)
+recv_view = memoryview(recv_buffer)
+frame_ring = FrameRing(RING_SLOTS, output.decoder.num_pixels)
+reported_overflows = 0
+# Reassembles fragmented frames per source; stale and incomplete frames are discarded
+assemblers = {}
+
+# Latest frame of every source, drawn as layers; frames are tagged with their layer in the ring
+compositor = Compositor(output.decoder.num_pixels, LAYER_TIMEOUT, LAYER_TIMEOUTS)
+output_interval = 1.0 / OUTPUT_FPS
+next_output = 0.0
+
+# Renders effects locally when a sender selects one with an effect control
+# packet; the effect is the bottom layer, under every streamed source
+effects = EffectEngine(load_coordinates(output.decoder.num_pixels))
+compositor.timeouts[EFFECT_SOURCE] = None
+
+# Runtime stats, served on STATS_PORT
+metrics = Metrics()
+metrics.gauge("assembler_dropped", lambda: sum(assembler.dropped for assembler in list(assemblers.values())))
+metrics.gauge("external_dropped", lambda: sum(receiver.dropped for _, receiver in external))
+metrics.gauge("ring_overflows", lambda: frame_ring.overflows)
+metrics.gauge("ring_depth", lambda: len(frame_ring))
+metrics.gauge("layers", lambda: len(compositor))
+metrics.gauge("layers_expired", lambda: compositor.expired)
+metrics.gauge("strip_shows_skipped", lambda: sum(output.skipped))
+metrics.gauge("frames_superseded", lambda: output.superseded)
+metrics.gauge("power_limited_frames", lambda: correction.limited)
+metrics.gauge("current_ma", lambda: round(correction.current))
+metrics.gauge("display_delay", lambda: DISPLAY_DELAY)
+for layout, show_time in zip(layouts, output.show_times):
+    metrics.histograms[f"show_time_strip{layout.id}"] = show_time
+decode_time = metrics.histogram("decode_time")
+queue_depth = metrics.histogram("queue_depth", bounds=list(range(RING_SLOTS + 1)))
+lateness = metrics.histogram("present_late_time")
+render_time = metrics.histogram("effect_render_time")
+serve_stats(metrics, UDP_IP, STATS_PORT)
+next_log = time.time() + STATS_LOG_INTERVAL
+
+# Senders that streamed frames in the last few intervals get a Feedback
+# report every FEEDBACK_INTERVAL so they can adapt their frame rate
+feedback_to = {}  # addr -> time.time() of its last frame datagram
+feedback_sources = {}  # addr -> the sources it sent frames for
+feedback_stats = IntervalStats()
+next_feedback = time.time() + FEEDBACK_INTERVAL
+# Frames of each source lost since the last report, so every sender only
+# hears about its own losses (interpolated frames the Pi made don't count)
+source_drops = {}
+# Sources with a new frame in the output the output thread has not taken yet
+pending_sources = set()
+
+
+def count_drop(source, n=1):
+    source_drops[source] = source_drops.get(source, 0) + n
+
+
+def push_frame(display_time, frame):
+    """Queues a frame; when the ring is full the frame due first is lost, counted against its source."""
+    if len(frame_ring) == RING_SLOTS:
+        count_drop(frame_ring.tag()[0])
+    frame_ring.push(display_time, frame.pixels, (frame.source, frame.blend, frame.opacity))
+
+
+def feedback_report(elapsed):
+    """
+    Feedback for the last elapsed seconds, from the running metrics.
+    dropped is left at 0; each sender is sent the drops of its own sources.
+    """
+    counters = metrics.counters
+    output_frames = feedback_stats.delta("output", counters.get("frames_output", 0))
+    for source, assembler in list(assemblers.items()):
+        count_drop(source, feedback_stats.delta(f"assembler{source}", assembler.dropped))
+    show_costs = [feedback_stats.mean(f"show{i}", hist) + wire
+                  for i, (hist, wire) in enumerate(zip(output.show_times, output.wire_times))]
+    frame_time = feedback_stats.mean("decode", decode_time)
+    # The output thread shows one frame while this one builds the next, so the slower of the two sets the pace
+    cost = max(show_costs + [frame_time])
+    return Feedback(output_frames / elapsed,
+                    feedback_stats.delta("received", counters.get("frames", 0)) / elapsed,
+                    0,
+                    max(show_costs, default=0.0), frame_time,
+                    1.0 / cost if output_frames and cost > 0 else 0.0)
+
+
+def select_effect(name, params):
+    """Starts an on-Pi effect ("off" stops it). Returns False if the name or parameters are invalid."""
+    try:
+        effects.start(name, params)
+    except ValueError as e:
+        print("Effect error:", e)
+        return False
+    print("Effect:", name, params)
+    # Drop held stream frames so the effect is not hidden under a stale
+    # one; sources still streaming come back with their next frame
+    for source in list(compositor.layers):
+        compositor.remove(source)
+    return True
+
 
 try:
     while True:
-        # Drain UDP buffer to get the latest frames
-        while True:
-            try:
-                data, addr = sock.recvfrom(65536)
-                frame_buffer.append((time.time() + DISPLAY_DELAY, data))
-            except BlockingIOError:
-                break
-
-        if not frame_buffer or time.time() < frame_buffer[0][0]:
-            time.sleep(0.001)
+        wake_times = []
+        if frame_ring:
+            wake_times.append(frame_ring.display_time())
+            if INTERPOLATE and compositor:
+                wake_times.append(next_output)
+        if effects.active:
+            wake_times.append(effects.next_frame)
+        expiry = compositor.next_expiry()
+        if expiry is not None:
+            wake_times.append(expiry)
+        if STATS_LOG_INTERVAL:
+            # Wake up for the stats line even when no frames are waiting
+            wake_times.append(next_log)
+        if feedback_to:
+            wake_times.append(next_feedback)
+        timeout = max(0.0, min(wake_times) - time.time()) if wake_times else None
+
+        # Set whenever the composited frame has to be rebuilt and shown
+        refresh = False
+        # Sources with a new frame in it
+        fresh = set()
+
+        ready = [key.fileobj for key, _ in selector.select(timeout)]
+
+        if controls in ready:
+            changes = controls.take()
+            if "delay" in changes:
+                DISPLAY_DELAY = changes["delay"]
+            if "brightness" in changes:
+                correction.set_level(changes["brightness"])
+                refresh = True
+            if "effect" in changes and select_effect(changes["effect"], {}):
+                refresh = True
+
+        if sock in ready:
+            # Drain UDP buffer to get the latest frames
+            while True:
+                try:
+                    nbytes, addr = sock.recvfrom_into(recv_buffer)
+                except BlockingIOError:
+                    break
+                now = time.time()
+                datagram = recv_view[:nbytes]
+                metrics.count("packets")
+
+                # Answer clock sync pings so senders can schedule frames in our clock
+                reply = sync_reply(datagram, now)
+                if reply is not None:
+                    sock.sendto(reply, addr)
+                    continue
+
+                try:
+                    effect = parse_effect(datagram)
+                except ValueError as e:
+                    print("Bad effect packet:", e)
+                    continue
+                if effect is not None:
+                    if select_effect(*effect):
+                        refresh = True
+                    continue
+
+                source = frame_source(datagram)
+                assembler = assemblers.get(source)
+                if assembler is None:
+                    assembler = assemblers[source] = FrameAssembler()
+                frame = assembler.add(datagram)
+                feedback_to[addr] = now
+                feedback_sources.setdefault(addr, set()).add(source)
+                if frame is not None:
+                    metrics.count("frames")
+                    # Scheduled frames carry their display time, others are shown on arrival
+                    display_time = frame.timestamp if frame.scheduled else now
+                    if display_time + DISPLAY_DELAY < now:
+                        metrics.count("frames_late")
+                    push_frame(display_time + DISPLAY_DELAY, frame)
+
+        for ext_sock, receiver in external:
+            if ext_sock not in ready:
+                continue
+            while True:
+                try:
+                    nbytes, _ = ext_sock.recvfrom_into(recv_buffer)
+                except BlockingIOError:
+                    break
+                metrics.count("external_packets")
+                # Frames are complete on their push or sync packet and shown on arrival
+                frame = receiver.add(recv_view[:nbytes])
+                if frame is not None:
+                    metrics.count("frames")
+                    push_frame(time.time() + DISPLAY_DELAY, frame)
+
+        if frame_ring.overflows != reported_overflows:
+            print(f"Frame ring full, dropped {frame_ring.overflows - reported_overflows} frames")
+            reported_overflows = frame_ring.overflows
+
+        if STATS_LOG_INTERVAL and time.time() >= next_log:
+            print(metrics.log_line())
+            next_log = time.time() + STATS_LOG_INTERVAL
+
+        if time.time() >= next_feedback:
+            report = feedback_report(time.time() - next_feedback + FEEDBACK_INTERVAL)
+            for addr, last_seen in list(feedback_to.items()):
+                if time.time() - last_seen > 5 * FEEDBACK_INTERVAL:
+                    del feedback_to[addr]
+                    del feedback_sources[addr]
+                    continue
+                dropped = sum(source_drops.get(source, 0) for source in feedback_sources[addr])
+                try:
+                    sock.sendto(feedback_message(report._replace(dropped=dropped)), addr)
+                except OSError as e:
+                    print("Feedback send error:", e)
+            source_drops.clear()
+            next_feedback = time.time() + FEEDBACK_INTERVAL
+
+        if compositor.expire(time.time()):
+            refresh = True
+
+        if effects.active and time.time() >= effects.next_frame:
+            start = time.perf_counter()
+            compositor.set(EFFECT_SOURCE, time.time(), effects.render(time.time()))
+            render_time.record(time.perf_counter() - start)
+            metrics.count("effect_frames")
+            refresh = True
+
+        if frame_ring and time.time() >= frame_ring.display_time():
+            queue_depth.record(len(frame_ring))
+            lateness.record(time.time() - frame_ring.display_time())
+            # Every due frame updates its layer, so when we fall behind only
+            # the newest frame of each source is shown
+            due = 0
+            while frame_ring and time.time() >= frame_ring.display_time():
+                source, blend, opacity = frame_ring.tag()
+                if source in fresh:
+                    # Replaced by a newer frame of the same source before it was shown
+                    count_drop(source)
+                display_time = frame_ring.display_time()
+                compositor.set(source, display_time, frame_ring.pop(), blend, opacity)
+                fresh.add(source)
+                due += 1
+            metrics.count("frames_shown", len(fresh))
+            metrics.count("frames_skipped_behind", due - len(fresh))
+            refresh = True
+        elif INTERPOLATE and frame_ring and compositor and time.time() >= next_output:
+            metrics.count("frames_interpolated")
+            refresh = True
+
+        if not refresh:
+            continue
+
+        if not compositor:
+            # Every source stopped or timed out
+            output.clear()
+            pending_sources = set()
             continue
 
-        # Skip frames if we are falling behind
-        while len(frame_buffer) > 1 and time.time() > frame_buffer[1][0]:
-            frame_buffer.popleft()
-
-        _, data = frame_buffer.popleft()
-
-        # The data is a flat byte array: [r,g,b,r,g,b,...]
-        # We process it in chunks of 3 bytes.
-        num_pixels = len(data) // 3
-        for i in range(num_pixels):
-            r = data[i*3]
-            g = data[i*3 + 1]
-            b = data[i*3 + 2]
-            
-            # Determine which strip and which LED on that strip to light up
-            strip_index = i // NUM_LEDS_PER_STRIP
-            led_index = i % NUM_LEDS_PER_STRIP
-            
-            if strip_index == 0:
-                strip1.setPixelColor(led_index, Color(r, g, b))
-            elif strip_index == 1:
-                strip2.setPixelColor(led_index, Color(r, g, b))
-            elif strip_index == 2:
-                strip3.setPixelColor(led_index, Color(r, g, b))
-
-        # Show strips sequentially; the library is not thread-safe
-        strip1.show()
-        strip2.show()
-        strip3.show()
-       # print("Frame displayed")
+        # Layers with a frame queued blend towards it until it is due
+        now = time.time()
+        upcoming = {}
+        if INTERPOLATE:
+            for i in range(len(frame_ring)):
+                source = frame_ring.tag(i)[0]
+                if source not in upcoming and source in compositor.layers:
+                    upcoming[source] = (frame_ring.display_time(i), frame_ring.peek(i))
+
+        # The composited data is a flat byte array: [r,g,b,r,g,b,...]
+        start = time.perf_counter()
+        output.write(compositor.compose(now, upcoming))
+        decode_time.record(time.perf_counter() - start)
+        superseded = output.superseded
+        output.show()
+        if output.superseded != superseded:
+            # The output thread never took the previous frame: sources with a
+            # new frame in both lost one, the others' frames are still in this one
+            for source in pending_sources & fresh:
+                count_drop(source)
+            pending_sources |= fresh
+        else:
+            pending_sources = fresh
+        metrics.count("frames_output")
+        next_output = now + output_interval
 
 except KeyboardInterrupt:
     print("Exiting, turning off LEDs")
-    for i in range(NUM_LEDS_PER_STRIP):
-        strip1.setPixelColor(i, Color(0, 0, 0))
-        strip2.setPixelColor(i, Color(0, 0, 0))
-        strip3.setPixelColor(i, Color(0, 0, 0))
-    strip1.show()
-    strip2.show()
-    strip3.show()
+    print(f"Skipped {sum(output.skipped)} of {sum(output.skipped) + sum(output.shown)} strip shows "
+          f"({output.skipped_frames} identical frames)")
+    print(f"{output.superseded} frames were replaced before the output thread could show them")
+    output.clear()
@@ -0,0 +1,81 @@
+import sys
+import time
+from led_frames import ColorCorrection, PipelinedOutput
+from led_show import ShowFile
+from led_topology import load_topology, pixel_strips
+
+# =============================
+# CONFIGURATION
+# =============================
+# LED strip configuration; pins, DMA channels, lengths and pixel layout are in topology.json
+LED_FREQ_HZ = 800000
+LED_BRIGHTNESS = 255
+LED_INVERT = False
+
+# Senders emit linear RGB; it is gamma corrected, white balanced and then
+# scaled down as a whole if it would draw more than the supply can give
+GAMMA = 2.2
+WHITE_BALANCE = (1.0, 1.0, 1.0)  # r, g, b multipliers, e.g. (1.0, 0.85, 0.7) to warm up white
+POWER_LIMIT_MA = 10000           # supply current budget in mA, 0 to disable
+
+# Usage: python3 play_show.py <show file> [start seconds] [loop]
+#   sudo python3 play_show.py xmas.show
+#   sudo python3 play_show.py xmas.show 95.5 loop
+if len(sys.argv) < 2:
+    print("Usage: python3 play_show.py <show file> [start seconds] [loop]")
+    exit(1)
+
+show = ShowFile(sys.argv[1])
+start_at = float(sys.argv[2]) if len(sys.argv) > 2 and sys.argv[2] != "loop" else 0.0
+loop = "loop" in sys.argv[2:]
+
+layouts = load_topology()
+strips = pixel_strips(layouts, LED_FREQ_HZ, LED_INVERT, LED_BRIGHTNESS)
+# Same output path as pi_server.py, so a show looks exactly like it does streamed
+correction = ColorCorrection(GAMMA, WHITE_BALANCE, POWER_LIMIT_MA, brightness=LED_BRIGHTNESS)
+output = PipelinedOutput(strips, [layout.index for layout in layouts], correction)
+
+if show.num_pixels != output.decoder.num_pixels:
+    print(f"Warning: show has {show.num_pixels} pixels, the topology {output.decoder.num_pixels}")
+print(f"Playing {sys.argv[1]}: {show.frame_count} frames of {show.num_pixels} pixels "
+      f"at {show.fps:g} fps ({show.duration:.1f}s){', looping' if loop else ''}")
+
+
+def seek(seconds):
+    """Returns the perf_counter() time frame 0 would have been shown at for playback to be at seconds now."""
+    return time.perf_counter() - min(max(seconds, 0.0), show.duration)
+
+
+frame_interval = 1.0 / show.fps
+start_time = seek(start_at)
+skipped = 0
+last_frame = -1
+try:
+    while True:
+        # Frames are due on a fixed schedule from start_time, so timing
+        # errors never accumulate; when late, jump to the frame due now
+        n = int((time.perf_counter() - start_time) * show.fps)
+        if n >= show.frame_count:
+            if not loop or show.frame_count == 0:
+                break
+            start_time += show.frame_count * frame_interval
+            last_frame = -1
+            continue
+        skipped += max(0, n - last_frame - 1)
+        last_frame = n
+
+        output.write(show.frame(n))
+        output.show()
+
+        delay = start_time + (n + 1) * frame_interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    output.flush()
+    print(f"Show finished, {skipped} frames skipped")
+
+except KeyboardInterrupt:
+    print(f"Stopped at {last_frame * frame_interval:.1f}s, {skipped} frames skipped")
+finally:
+    output.clear()
+    show.close()
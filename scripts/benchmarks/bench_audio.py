@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_audio import SpectralAnalyzer
+
+# =============================
+# CONFIGURATION
+# =============================
+SAMPLERATE = 44100
+WINDOWS = [512, 1024, 2048]
+HOP = 256
+SECONDS = 10.0
+BEAT_INTERVAL = 0.5  # seconds between synthetic kick drums
+
+# Time SpectralAnalyzer takes per hop in the audio callback, whose budget
+# is one hop of audio (5.8 ms at 256 samples), and how many of the
+# synthetic kicks (a decaying 60 Hz thump over a tone and noise) it finds
+# within 30 ms. Longer windows resolve bass better but smear the attack
+# over more hops, so short kicks stop standing out from the noise.
+rng = np.random.default_rng(1)
+t = np.arange(int(SAMPLERATE * SECONDS)) / SAMPLERATE
+signal = 0.02 * rng.standard_normal(len(t)) + 0.1 * np.sin(2 * np.pi * 440 * t)
+beats = np.arange(BEAT_INTERVAL / 2, SECONDS, BEAT_INTERVAL)
+kick = int(0.1 * SAMPLERATE)
+envelope = np.exp(-np.arange(kick) / (0.02 * SAMPLERATE))
+for beat in beats:
+    start = int(beat * SAMPLERATE)
+    signal[start:start + kick] += 0.6 * envelope * np.sin(2 * np.pi * 60 * np.arange(kick) / SAMPLERATE)
+signal = signal.astype(np.float32)
+
+print(f"{'window':>7} {'ms/hop':>7} {'% of hop':>9} {'kicks found':>12} {'extra onsets':>13}")
+for win in WINDOWS:
+    analyzer = SpectralAnalyzer(SAMPLERATE, win)
+    onsets = []
+    hops = range(0, len(signal) - HOP, HOP)
+    start = time.perf_counter()
+    for offset in hops:
+        if analyzer.process(signal[offset:offset + HOP]):
+            onsets.append((offset + HOP) / SAMPLERATE)
+    per_hop = (time.perf_counter() - start) / len(hops)
+    onsets = np.array(onsets)
+    # An onset counts for a kick if it comes within 30 ms after it
+    found = sum(1 for beat in beats if np.any((onsets >= beat) & (onsets < beat + 0.03)))
+    extra = sum(1 for onset in onsets if not np.any((onset >= beats) & (onset < beats + 0.03)))
+    print(f"{win:>7} {per_hop * 1000:>7.3f} {per_hop * SAMPLERATE / HOP * 100:>8.1f}% "
+          f"{found:>5}/{len(beats):<6} {extra:>13}")
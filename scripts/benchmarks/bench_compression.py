@@ -0,0 +1,89 @@
+import json
+import os
+import random
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "03_execution"))
+import fire
+import pc_server
+import temp
+from led_effects import load_coordinates
+from led_protocol import ENCODINGS, FrameEncoder
+from led_render import FlashKernels, FrameBuffer
+
+# =============================
+# CONFIGURATION
+# =============================
+COORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "coordinates", "savedata_adjusted.json")
+FRAME_RATE = 30
+SECONDS = 20
+
+random.seed(0)
+np.random.seed(0)
+
+# The generators below run the effects of each bundled sender (fire.py's
+# FireEffect, pc_server.py's flash, temp.py's BeatLights) with their LED
+# counts and send pattern, standing in for the audio input with beats at a
+# steady random rate, and keep the frames they would put on the wire.
+
+def fire_frames():
+    """fire.py: every LED changes every frame, top half dark."""
+    with open(COORDS_FILE, 'r') as f:
+        coords = np.array(json.load(f), dtype=np.float32)
+    frame = FrameBuffer(len(coords))
+    effect = fire.FireEffect(coords)
+    for n in range(FRAME_RATE * SECONDS):
+        effect.render(n / FRAME_RATE, frame)
+        yield bytes(frame.commit())
+
+
+def metronome_frames():
+    """pc_server.py: a flash on every tick followed by a black frame."""
+    frame = FrameBuffer(pc_server.NUM_LEDS)
+    kernels = FlashKernels(pc_server.NUM_LEDS)
+    for _ in range(2 * SECONDS):  # 120 bpm
+        pc_server.flash(frame, kernels, intensity=random.uniform(0.6, 2.5))
+        yield bytes(frame.commit())
+        frame.clear()
+        yield bytes(frame.commit())
+
+
+def mix_frames():
+    """temp.py: flash/sparkle/wipe on beats, decaying buffer sent at ~30 fps."""
+    frame = FrameBuffer(temp.NUM_LEDS)
+    lights = temp.BeatLights(temp.NUM_LEDS, load_coordinates(temp.NUM_LEDS, COORDS_FILE) if temp.FLASH_3D else None)
+    blocks_per_second = 44100 / temp.hop_s
+    blocks_per_frame = round(blocks_per_second / FRAME_RATE)
+    for n in range(FRAME_RATE * SECONDS * blocks_per_frame):
+        lights.render(n / blocks_per_second, frame)
+        if random.random() < 2.0 / blocks_per_second:  # ~2 beats per second
+            lights.beat(frame, random.uniform(0.3, 3.0) * 1.2)
+        if n % blocks_per_frame == 0:
+            yield bytes(frame.commit())
+
+
+def resolve_delay_frames():
+    """resolve_delay.py: all LEDs full white while there is sound, black otherwise."""
+    for n in range(FRAME_RATE * SECONDS):
+        yield bytes([255 if (n // 15) % 2 else 0]) * (600 * 3)
+
+
+EFFECTS = {
+    "fire": fire_frames,
+    "metronome": metronome_frames,
+    "mix": mix_frames,
+    "resolve_delay": resolve_delay_frames,
+}
+
+print(f"{'effect':<14} {'LEDs':>5}" + "".join(f" {e + ' B/frame':>16}" for e in ENCODINGS) + f" {'delta saving':>13}")
+for name, frames in EFFECTS.items():
+    frames = list(frames())
+    sizes = {}
+    for encoding in ENCODINGS:
+        encoder = FrameEncoder(encoding)
+        total = sum(len(d) for frame in frames for d in encoder.encode(frame))
+        sizes[encoding] = total / len(frames)
+    print(f"{name:<14} {len(frames[0]) // 3:>5}" + "".join(f" {sizes[e]:>16.0f}" for e in ENCODINGS)
+          + f" {sizes['raw'] / sizes['delta']:>12.1f}x")
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_frames import FrameDecoder
+
+# =============================
+# CONFIGURATION
+# =============================
+LED_COUNTS = [150, 600, 2400]
+NUM_STRIPS = 3
+REPEATS = 200
+
+
+class FakeStrip:
+    """Stands in for rpi_ws281x.PixelStrip so the old decode path can run off the Pi."""
+
+    def __init__(self, num):
+        self.pixels = [0] * num
+
+    def setPixelColor(self, n, color):
+        self.pixels[n] = color
+
+
+def Color(red, green, blue, white=0):
+    return (white << 24) | (red << 16) | (green << 8) | blue
+
+
+def old_decode(data, strips, leds_per_strip):
+    """The per-pixel loop pi_server.py used before FrameDecoder."""
+    num_pixels = len(data) // 3
+    for i in range(num_pixels):
+        r = data[i*3]
+        g = data[i*3 + 1]
+        b = data[i*3 + 2]
+        strip_index = i // leds_per_strip
+        led_index = i % leds_per_strip
+        if strip_index < len(strips):
+            strips[strip_index].setPixelColor(led_index, Color(r, g, b))
+
+
+def time_per_frame(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+print(f"{'LEDs':>6} {'old (ms)':>10} {'new (ms)':>10} {'speedup':>8}")
+for num_leds in LED_COUNTS:
+    leds_per_strip = -(-num_leds // NUM_STRIPS)
+    data = bytes(np.random.randint(0, 256, num_leds * 3, dtype=np.uint8))
+
+    strips = [FakeStrip(leds_per_strip) for _ in range(NUM_STRIPS)]
+    decoder = FrameDecoder([np.zeros((leds_per_strip, 4), dtype=np.uint8) for _ in range(NUM_STRIPS)])
+
+    # Both paths must agree on the packed 0xWWRRGGBB values
+    old_decode(data, strips, leds_per_strip)
+    decoder.decode(data)
+    for strip, buf in zip(strips, decoder.buffers):
+        assert strip.pixels == buf.view("<u4").ravel().tolist()
+
+    old_t = time_per_frame(lambda: old_decode(data, strips, leds_per_strip), REPEATS)
+    new_t = time_per_frame(lambda: decoder.decode(data), REPEATS)
+    print(f"{num_leds:>6} {old_t * 1000:>10.3f} {new_t * 1000:>10.3f} {old_t / new_t:>7.1f}x")
@@ -0,0 +1,32 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_effects import EFFECTS, EffectEngine, load_coordinates
+from led_frames import Compositor
+
+# =============================
+# CONFIGURATION
+# =============================
+COORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "coordinates", "savedata_adjusted.json")
+LED_COUNTS = [150, 600, 2400]
+FRAME_RATE = 30
+REPEATS = 300
+
+# Time to render one frame of each on-Pi effect and compose it as
+# pi_server.py does; at FRAME_RATE a frame has 1000 / FRAME_RATE ms, and
+# decoding and showing it need most of that.
+print(f"{'effect':>8} {'LEDs':>6} {'ms/frame':>9} {'% of frame':>11}")
+for num_leds in LED_COUNTS:
+    engine = EffectEngine(load_coordinates(num_leds, COORDS_FILE))
+    compositor = Compositor(num_leds)
+    for name in EFFECTS:
+        engine.start(name, {})
+        start = time.perf_counter()
+        for n in range(REPEATS):
+            t = engine.start_time + n / FRAME_RATE
+            compositor.set(-1, t, engine.render(t))
+            compositor.compose(t)
+        per_frame = (time.perf_counter() - start) / REPEATS
+        print(f"{name:>8} {num_leds:>6} {per_frame * 1000:>9.3f} {per_frame * FRAME_RATE * 100:>10.1f}%")
@@ -0,0 +1,62 @@
+import colorsys
+import math
+import os
+import random
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+from led_effects import load_coordinates
+from led_render import FlashKernels
+
+# =============================
+# CONFIGURATION
+# =============================
+COORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "coordinates", "savedata_adjusted.json")
+LED_COUNTS = [50, 600, 2000]
+REPEATS = 200
+
+# Time to draw one beat flash (temp.py's random 15-40 LED scales, up to two
+# centres) in the audio callback, whose whole budget is a 256-sample block
+# (5.8 ms at 44.1 kHz): the old per-LED exp() loop against the cached
+# kernels along the string, and the kernels computed per flash on the tree
+# (FLASH_3D).
+
+
+def list_flash(num_leds, centers, scale, color, intensity):
+    frame = [[0, 0, 0] for _ in range(num_leds)]
+    for c in centers:
+        for i in range(num_leds):
+            brightness = min(1.0, intensity * math.exp(-((i - c) ** 2) / (2 * scale ** 2)))
+            for k in range(3):
+                frame[i][k] = min(255, frame[i][k] + int(color[k] * brightness))
+    return frame
+
+
+def kernel_flash(kernels, out, centers, scale, color, intensity):
+    out.fill(0.0)
+    for c in centers:
+        kernels.add(out, c, scale, color, intensity)
+
+
+def ms_per_flash(flash, num_leds, repeats):
+    random.seed(1)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        centers = [random.randint(0, num_leds - 1) for _ in range(random.choice([1, 1, 2]))]
+        color = [int(c * 255) for c in colorsys.hsv_to_rgb(random.random(), 1.0, 1.0)]
+        flash(centers, random.randint(15, 40), color, random.uniform(0.4, 3.6))
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+print(f"{'LEDs':>6} {'list ms':>8} {'string ms':>10} {'3D ms':>8} {'string cache hits':>18}")
+for num_leds in LED_COUNTS:
+    out = np.zeros((num_leds, 3), dtype=np.float32)
+    string = FlashKernels(num_leds)
+    tree = FlashKernels(num_leds, load_coordinates(num_leds, COORDS_FILE))
+    old = ms_per_flash(lambda *args: list_flash(num_leds, *args), num_leds, max(5, REPEATS // 20))
+    new = ms_per_flash(lambda *args: kernel_flash(string, out, *args), num_leds, REPEATS)
+    new_3d = ms_per_flash(lambda *args: kernel_flash(tree, out, *args), num_leds, REPEATS)
+    print(f"{num_leds:>6} {old:>8.3f} {new:>10.3f} {new_3d:>8.3f} "
+          f"{string.hits / max(1, string.hits + string.misses) * 100:>17.0f}%")
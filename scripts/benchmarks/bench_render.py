@@ -0,0 +1,156 @@
+import colorsys
+import math
+import os
+import random
+import socket
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "03_execution"))
+from fire import FireEffect
+from led_effects import load_coordinates
+from led_protocol import FrameSender
+from led_render import FlashKernels, FrameBuffer
+
+# =============================
+# CONFIGURATION
+# =============================
+COORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "coordinates", "savedata_adjusted.json")
+LED_COUNTS = [50, 600, 2400, 10000]
+DURATION = 1.0  # seconds per measurement
+
+# Frames per second the senders can render, serialise and send, with the
+# per-LED Python lists they used to build and the shared FrameBuffer they
+# use now. Frames go as raw datagrams to a local socket that never reads
+# them, so the network is not part of the measurement.
+
+
+# --- before: lists of [r, g, b] built per frame, as in fire.py, temp.py and pc_server.py ---
+
+def list_fire(coords, t):
+    min_y, max_y = np.min(coords[:, 1]), np.max(coords[:, 1])
+    frame = [[0, 0, 0] for _ in range(len(coords))]
+    for i in range(len(coords)):
+        x, y, z = coords[i]
+        y = y - t * 0.6
+        noise = (math.sin(x * 1.5 * 0.5 + y * 0.2 + z * 1.5 * 0.3)
+                 + math.sin(x * 1.5 * 1.2 - y * 0.8 + z * 1.5 * 0.7)
+                 + math.sin(x * 1.5 * 2.1 + y * 1.5 - z * 1.5 * 1.3) + 3.0) / 6.0
+        heat = max(0, min(1, noise * (1.0 - (coords[i][1] - min_y) / (max_y - min_y)) ** 2))
+        if heat < 0.2:
+            frame[i] = [int(heat * 5 * 60), 0, 0]
+        elif heat < 0.5:
+            frame[i] = [60 + int((heat - 0.2) / 0.3 * 195), 0, 0]
+        elif heat < 0.8:
+            frame[i] = [255, int((heat - 0.5) / 0.3 * 255), 0]
+        else:
+            frame[i] = [255, 255, int((heat - 0.8) / 0.2 * 255)]
+    return frame
+
+
+def list_flash(num_leds, intensity, scale):
+    frame = [[0, 0, 0] for _ in range(num_leds)]
+    base_color = [int(c * 255) for c in colorsys.hsv_to_rgb(random.random(), 1.0, 1.0)]
+    c = random.randint(0, num_leds - 1)
+    for i in range(num_leds):
+        brightness = min(1.0, intensity * math.exp(-((i - c) ** 2) / (2 * scale ** 2)))
+        for k in range(3):
+            frame[i][k] = min(255, frame[i][k] + int(base_color[k] * brightness))
+    return frame
+
+
+def before_fire(coords, sender):
+    def frame(t):
+        sender.send(bytearray([int(c) for color in list_fire(coords, t) for c in color]))
+    return frame
+
+
+def before_beats(num_leds, sender):
+    # temp.py: decay a float buffer, add a flash on every beat, send
+    led_buffer = np.zeros((num_leds, 3), dtype=float)
+
+    def frame(t):
+        nonlocal led_buffer
+        led_buffer *= 0.92
+        led_buffer += np.array(list_flash(num_leds, 1.5, 25))
+        output_frame = np.clip(led_buffer, 0, 255).astype(int)
+        sender.send(bytearray([c for pixel in output_frame for c in pixel]))
+    return frame
+
+
+def before_metronome(num_leds, sender):
+    # pc_server.py: a flash on every tick
+    def frame(t):
+        sender.send(bytearray([int(c) for color in list_flash(num_leds, 1.5, 3) for c in color]))
+    return frame
+
+
+# --- after: effects drawing into a preallocated FrameBuffer, sent from its bytes ---
+
+def after_fire(coords, sender):
+    buffer = FrameBuffer(len(coords))
+    fire = FireEffect(coords)
+
+    def frame(t):
+        fire.render(t, buffer)
+        sender.send(buffer.commit())
+    return frame
+
+
+def after_flash(kernels, out, intensity, scale):
+    base_color = [int(c * 255) for c in colorsys.hsv_to_rgb(random.random(), 1.0, 1.0)]
+    kernels.add(out, random.randint(0, kernels.num_pixels - 1), scale, base_color, intensity)
+
+
+def after_beats(num_leds, sender):
+    buffer = FrameBuffer(num_leds)
+    kernels = FlashKernels(num_leds)
+    burst = np.zeros((num_leds, 3), dtype=np.float32)
+
+    def frame(t):
+        buffer.fade(0.92)
+        burst.fill(0.0)
+        after_flash(kernels, burst, 1.5, 25)
+        buffer.level += burst
+        sender.send(buffer.commit())
+    return frame
+
+
+def after_metronome(num_leds, sender):
+    buffer = FrameBuffer(num_leds)
+    kernels = FlashKernels(num_leds)
+
+    def frame(t):
+        buffer.clear()
+        after_flash(kernels, buffer.level, 1.5, 3)
+        sender.send(buffer.commit())
+    return frame
+
+
+def frames_per_second(frame):
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < DURATION:
+        frame(n / 30)
+        n += 1
+    return n / (time.perf_counter() - start)
+
+
+sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+sink.bind(("127.0.0.1", 0))
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+old_sender = FrameSender(sock, sink.getsockname(), "raw")
+old_sender.scatter_gather = False  # header and payload joined per datagram, as before
+new_sender = FrameSender(sock, sink.getsockname(), "raw")
+
+print(f"{'effect':>10} {'LEDs':>6} {'before fps':>11} {'after fps':>10} {'speedup':>8}")
+for num_leds in LED_COUNTS:
+    coords = load_coordinates(num_leds, COORDS_FILE)
+    for name, before, after in [("fire", before_fire(coords, old_sender), after_fire(coords, new_sender)),
+                                ("beats", before_beats(num_leds, old_sender), after_beats(num_leds, new_sender)),
+                                ("metronome", before_metronome(num_leds, old_sender), after_metronome(num_leds, new_sender))]:
+        old_fps = frames_per_second(before)
+        new_fps = frames_per_second(after)
+        print(f"{name:>10} {num_leds:>6} {old_fps:>11.0f} {new_fps:>10.0f} {new_fps / old_fps:>7.1f}x")
@@ -0,0 +1,217 @@
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RPi"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "03_execution"))
+import fire
+import pc_server
+import temp
+from led_protocol import FrameSender
+from led_render import FlashKernels, FrameBuffer
+
+# =============================
+# CONFIGURATION
+# =============================
+LED_COUNTS = [50, 600, 2400, 10000]
+DURATION = 0.5  # seconds of frames per timed pass
+REPEATS = 3  # timed passes per effect and LED count; the fastest counts, the others were disturbed
+ALLOC_FRAMES = 100  # frames rendered again under tracemalloc to measure allocations
+FRAME_RATE = 30  # spacing of the t passed to the effects
+REGRESSION_THRESHOLD = 0.10  # fps drop against the baseline that counts as a regression
+
+# Usage: python bench_throughput.py [<results.json> [<baseline.json>]]
+# Times every sender effect rendering, encoding and sending frames as fast
+# as it can: frames/sec, the per-frame time percentiles, the bytes sent
+# per frame, the peak memory allocated while rendering a frame and what is
+# still allocated afterwards (a leak if it keeps growing, or a cache
+# filling up). Each row is the fastest of REPEATS passes. The effects
+# are the real ones from fire.py, pc_server.py and temp.py on synthetic
+# coordinates, sending through each sender's FRAME_ENCODING into a socket
+# stand-in that only counts the datagrams. Results are written as JSON;
+# given a baseline from an earlier run, every row is compared with it and
+# the exit status is 1 if any effect got more than REGRESSION_THRESHOLD
+# slower.
+
+
+class MemorySink:
+    """Stands in for the senders' UDP socket: takes datagrams from sendmsg()/sendto() and counts them."""
+
+    def __init__(self):
+        self.datagrams = 0
+        self.bytes = 0
+
+    def sendmsg(self, buffers, ancdata=(), flags=0, address=None):
+        self.datagrams += 1
+        self.bytes += sum(memoryview(b).nbytes for b in buffers)
+
+    def sendto(self, data, address):
+        self.datagrams += 1
+        self.bytes += memoryview(data).nbytes
+
+
+def tree_coords(num_leds, turns=20):
+    """LEDs wound in a spiral up a cone, in the -1..1 units of the calibrated coordinates."""
+    rng = np.random.default_rng(1)
+    height = np.linspace(0.0, 1.0, num_leds)
+    angle = 2 * np.pi * turns * height
+    radius = 1.0 - height
+    coords = np.stack([radius * np.cos(angle), 2 * height - 1, radius * np.sin(angle)], axis=1)
+    coords += rng.normal(0.0, 0.01, coords.shape)  # calibration error
+    return coords.astype(np.float32)
+
+
+def make_sender(module):
+    return FrameSender(MemorySink(), ("127.0.0.1", module.UDP_PORT), module.FRAME_ENCODING,
+                       source=module.LAYER_SOURCE, blend=module.LAYER_BLEND)
+
+
+# --- one frame of each effect, rendered and sent as its sender does ---
+
+def fire_frames(coords):
+    sender = make_sender(fire)
+    frame = FrameBuffer(len(coords))
+    effect = fire.FireEffect(coords)
+
+    def render(t):
+        effect.render(t, frame)
+        sender.send(frame.commit())
+    return sender, render
+
+
+def metronome_frames(coords):
+    # pc_server.py on a metronome tick
+    sender = make_sender(pc_server)
+    frame = FrameBuffer(len(coords))
+    kernels = FlashKernels(len(coords))
+
+    def render(t):
+        pc_server.flash(frame, kernels, intensity=1.5)
+        sender.send(frame.commit())
+    return sender, render
+
+
+def beat_frames(coords, effect=None, flash_3d=False):
+    # temp.py with a beat on every frame; effect is a BeatLights method name, None for its random mix
+    sender = make_sender(temp)
+    frame = FrameBuffer(len(coords))
+    lights = temp.BeatLights(len(coords), coords if flash_3d else None)
+    beat = getattr(lights, effect) if effect else None
+
+    def render(t):
+        lights.render(t, frame)
+        lights.beat(frame, 1.5, beat)
+        sender.send(frame.commit())
+    return sender, render
+
+
+EFFECTS = [
+    ("fire", fire_frames),
+    ("metronome", metronome_frames),
+    ("flash", lambda coords: beat_frames(coords, "flash")),
+    ("flash 3D", lambda coords: beat_frames(coords, "flash", flash_3d=True)),
+    ("sparkle", lambda coords: beat_frames(coords, "sparkle")),
+    ("wipe", lambda coords: beat_frames(coords, "wipe")),
+    ("beats", lambda coords: beat_frames(coords)),
+]
+
+
+def measure(name, make, num_leds):
+    random.seed(1)
+    np.random.seed(1)
+    sender, render = make(tree_coords(num_leds))
+    for n in range(10):
+        render(n / FRAME_RATE)
+
+    sink = sender.sock
+    fps = 0.0
+    for _ in range(REPEATS):
+        times = []
+        sent = sink.bytes
+        start = time.perf_counter()
+        while time.perf_counter() - start < DURATION:
+            frame_start = time.perf_counter()
+            render(len(times) / FRAME_RATE)
+            times.append(time.perf_counter() - frame_start)
+        elapsed = time.perf_counter() - start
+        if len(times) / elapsed > fps:
+            fps = len(times) / elapsed
+            durations = times
+            bytes_per_frame = (sink.bytes - sent) / len(times)
+
+    # Allocations, separately since tracing slows everything down
+    tracemalloc.start()
+    retained = tracemalloc.get_traced_memory()[0]
+    peak = 0
+    for n in range(ALLOC_FRAMES):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        render(n / FRAME_RATE)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    retained = tracemalloc.get_traced_memory()[0] - retained
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(durations, [50, 90, 99]) * 1000
+    return {
+        "effect": name,
+        "leds": num_leds,
+        "fps": fps,
+        "p50_ms": p50,
+        "p90_ms": p90,
+        "p99_ms": p99,
+        "max_ms": max(durations) * 1000,
+        "bytes_per_frame": bytes_per_frame,
+        "alloc_peak_kb": peak / 1024,
+        "retained_bytes_per_frame": retained / ALLOC_FRAMES,
+    }
+
+
+if len(sys.argv) > 3:
+    print("Usage: python bench_throughput.py [<results.json> [<baseline.json>]]")
+    exit(1)
+results_path = sys.argv[1] if len(sys.argv) > 1 else "bench_throughput.json"
+baseline = {}
+if len(sys.argv) > 2:
+    with open(sys.argv[2], 'r') as f:
+        baseline = {(r["effect"], r["leds"]): r for r in json.load(f)["results"]}
+
+results = []
+regressions = 0
+print(f"{'effect':>10} {'LEDs':>6} {'fps':>8} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'max ms':>7} "
+      f"{'bytes':>7} {'peak KB':>8} {'kept B':>7}" + (f" {'vs baseline':>12}" if baseline else ""))
+for num_leds in LED_COUNTS:
+    for name, make in EFFECTS:
+        r = measure(name, make, num_leds)
+        results.append(r)
+        line = (f"{name:>10} {num_leds:>6} {r['fps']:>8.0f} {r['p50_ms']:>7.3f} {r['p90_ms']:>7.3f} "
+                f"{r['p99_ms']:>7.3f} {r['max_ms']:>7.3f} {r['bytes_per_frame']:>7.0f} "
+                f"{r['alloc_peak_kb']:>8.1f} {r['retained_bytes_per_frame']:>7.0f}")
+        old = baseline.get((name, num_leds))
+        if old is not None:
+            change = r["fps"] / old["fps"] - 1
+            line += f" {change * 100:>+11.1f}%"
+            if change < -REGRESSION_THRESHOLD:
+                line += " slower"
+                regressions += 1
+        print(line)
+
+with open(results_path, 'w') as f:
+    json.dump({
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "duration": DURATION,
+        "repeats": REPEATS,
+        "results": results,
+    }, f, indent=1)
+print(f"Results written to {results_path}")
+if regressions:
+    print(f"{regressions} effects more than {REGRESSION_THRESHOLD * 100:.0f}% slower than {sys.argv[2]}")
+    exit(1)